@@ -15,13 +15,18 @@
 
 """Convert CodeReviewer to an EditingRtcExample dataset."""
 
+import collections
 from collections.abc import Iterator, Sequence
-import gzip
-import json
+import concurrent.futures
+import itertools
+import os
+from typing import Final
 
 from absl import app
 from absl import flags
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness.editing_rtc import task as editing_rtc
 
 _INPUT_PATH = flags.DEFINE_string(
@@ -37,33 +42,86 @@ _OUT_PATH = flags.DEFINE_string(
 )
 
 
+_NUM_WORKERS = flags.DEFINE_integer(
+    "num_workers",
+    None,
+    "The number of worker processes. Defaults to the number of CPUs.",
+)
+
+# The number of input lines converted by a worker per task.
+_LINES_PER_BATCH: Final[int] = 1000
+
+# The number of batches in flight per worker. This keeps the workers busy while
+# the main process compresses, without reading the whole input into memory.
+_BATCHES_IN_FLIGHT_PER_WORKER: Final[int] = 4
+
+
+# Line boundaries recognized by `str.splitlines`, other than "\n".
+_OTHER_LINE_BOUNDARIES: Final[tuple[str, ...]] = (
+    "\r", "\v", "\f", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029"
+)
+
+
 def _remove_annotation_symbol(block: str, symbol: str) -> str:
   """Removes the diff-related annotation symbol from the block."""
-  return "\n".join(l.removeprefix(symbol) for l in block.splitlines())
+  if any(boundary in block for boundary in _OTHER_LINE_BOUNDARIES):
+    return "\n".join(l.removeprefix(symbol) for l in block.splitlines())
+  block = block.removesuffix("\n").replace("\n" + symbol, "\n")
+  return block.removeprefix(symbol)
+
 
+def _convert_line(line: bytes) -> bytes:
+  """Converts a CodeReviewer jsonl line to a serialized EditingRtc example.
 
-def _iter_codereviewer() -> Iterator[editing_rtc.EditingRtcExample]:
-  """Iterates over CodeReviewer examples and generates EditingRtc examples ."""
-  with open(_INPUT_PATH.value, "r") as f:
-    for line in f:
-      ex = json.loads(line)
-      yield editing_rtc.EditingRtcExample(
+  Args:
+    line: A line of the CodeReviewer jsonl file.
+
+  Returns:
+    The json-serialized `EditingRtcExample`, terminated with a new line.
+  """
+  ex = orjson.loads(line)
+  return orjson.dumps(
+      editing_rtc.EditingRtcExample(
           filename="code_reviewer_refinement_test_{}".format(ex["ghid"]),
           code_before_edit=_remove_annotation_symbol(ex["old"], "-"),
           code_after_edit=_remove_annotation_symbol(ex["new"], "+"),
           ground_truth_edit_description=ex["comment"],
-      )
+      ),
+      option=orjson.OPT_APPEND_NEWLINE,
+  )
+
+
+def _convert_lines(lines: Sequence[bytes]) -> bytes:
+  """Converts a batch of lines to serialized EditingRtc examples."""
+  return b"".join(map(_convert_line, lines))
+
+
+def _iter_line_batches() -> Iterator[list[bytes]]:
+  """Iterates over batches of lines of the CodeReviewer jsonl file."""
+  with open(_INPUT_PATH.value, "rb") as f:
+    while batch := list(itertools.islice(f, _LINES_PER_BATCH)):
+      yield batch
 
 
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError("Too many command-line arguments.")
-  with gzip.open(open(_OUT_PATH.value, "wb"), "wb") as f:
+  num_workers = _NUM_WORKERS.value or os.cpu_count() or 1
+  max_in_flight = num_workers * _BATCHES_IN_FLIGHT_PER_WORKER
+  with (
+      concurrent.futures.ProcessPoolExecutor(num_workers) as executor,
+      gzip_utils.open_write(_OUT_PATH.value) as f,
+  ):
     # NOTE: The CodeReviewer test set is very large, and so we use only
     # a random subset of it for our experiments.
-    for e in _iter_codereviewer():
-      f.write(e.to_json().encode())
-      f.write(b"\n")
+    # Results are written in submission order, so runs are reproducible.
+    in_flight = collections.deque()
+    for batch in _iter_line_batches():
+      if len(in_flight) >= max_in_flight:
+        f.write(in_flight.popleft().result())
+      in_flight.append(executor.submit(_convert_lines, batch))
+    while in_flight:
+      f.write(in_flight.popleft().result())
 
 
 if __name__ == "__main__":
@@ -15,13 +15,13 @@
 
 """Run RTC execution evaluation on HumanEval."""
 
-import collections
 from collections.abc import Sequence
-import gzip
 
 from absl import app
 from absl import flags
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness import rtc_data as med
 from roundtrip_correctness.editing_rtc import task as ertc
 
@@ -41,53 +41,51 @@ _OUTPUT_FILE = flags.DEFINE_string(
 )
 
 
-def _compute_metrics(original: str, prediction: str) -> dict[str, float]:
-  return {"exact_match": float(prediction == original)}
+def _exact_match_scores(
+    original: str, samples: Sequence[med.Sample]
+) -> list[float]:
+  """Scores each sample on whether it exactly matches the original code."""
+  return [
+      float(s.text.partition("[old]")[0].strip() == original) for s in samples
+  ]
 
 
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError("Too many command-line arguments.")
 
+  decode_datapoint = med.make_decoder(ertc.EditingRtcExample)
   evaluated_samples = []
-  with gzip.open(open(_SAMPLES_PATH.value, "rb")) as f:
-    for line in f:
-      sample = med.GenerationSamplesForDatapoint.from_json(line.decode())
-      sample.datapoint = ertc.EditingRtcExample.from_dict(sample.datapoint)
-      original = sample.datapoint.code_after_edit.strip()
-      baseline_scores = collections.defaultdict(list)
-      all_backward_scores = collections.defaultdict(list)
-      for generation_sample in sample.generation_samples:
-        backward_scores = collections.defaultdict(list)
-        for backward_sample in generation_sample.backward_samples:
-          prediction = backward_sample.text.split("[old]")[0].strip()
-          pred_metrics = _compute_metrics(original, prediction)
-          for metric, value in pred_metrics.items():
-            backward_scores[metric].append(value)
-
-        for m, l in backward_scores.items():
-          all_backward_scores[m].append(l)
-
-      if sample.baseline_samples:
-        for baseline_sample in sample.baseline_samples:
-          prediction = baseline_sample.text.split("[old]")[0].strip()
-          pred_metrics = _compute_metrics(original, prediction)
-          for metric, value in pred_metrics.items():
-            baseline_scores[metric].append(value)
-
-      evaluated_sample = med.EvaluatedGenerationSamplesForDatapoint[
-          ertc.EditingRtcExample
-      ](
-          samples=sample,
-          generation_samples_consistencies=all_backward_scores,
-          baseline_samples_consistencies=baseline_scores,
-      )
-      evaluated_samples.append(evaluated_sample)
-
-  with gzip.open(open(_OUTPUT_FILE.value, "wb"), "wb") as f:
+  for line in gzip_utils.iter_lines(_SAMPLES_PATH.value):
+    sample = med.generation_samples_from_dict(orjson.loads(line))
+    sample.datapoint = decode_datapoint(sample.datapoint)
+    original = sample.datapoint.code_after_edit.strip()
+    all_backward_scores = [
+        _exact_match_scores(original, generation_sample.backward_samples)
+        for generation_sample in sample.generation_samples
+    ]
+
+    if sample.baseline_samples:
+      baseline_scores = {
+          "exact_match": _exact_match_scores(original, sample.baseline_samples)
+      }
+    else:
+      baseline_scores = {}
+
+    evaluated_sample = med.EvaluatedGenerationSamplesForDatapoint[
+        ertc.EditingRtcExample
+    ](
+        samples=sample,
+        generation_samples_consistencies={"exact_match": all_backward_scores},
+        baseline_samples_consistencies=baseline_scores,
+    )
+    evaluated_samples.append(evaluated_sample)
+
+  with gzip_utils.open_write(_OUTPUT_FILE.value) as f:
     for evaluated_sample in evaluated_samples:
-      f.write(evaluated_sample.to_json().encode())
-      f.write(b"\n")
+      f.write(
+          orjson.dumps(evaluated_sample, option=orjson.OPT_APPEND_NEWLINE)
+      )
 
 
 if __name__ == "__main__":
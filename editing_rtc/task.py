@@ -18,7 +18,6 @@
 from __future__ import annotations
 
 import dataclasses
-import io
 from typing import Collection
 
 import dataclasses_json
@@ -129,34 +128,30 @@ class EditingRtc(rtct.RoundTripCorrectnessTask[EditingRtcExample]):
       samples: rtcd.GenerationSamplesForDatapoint[EditingRtcExample],
   ) -> str:
     """See base class."""
-    with io.StringIO() as sb:
-      input_sample = samples.datapoint
-      sb.write(f'<h2>{input_sample.filename}</h2>\n')
-      sb.write('<pre>\n')
-      sb.write('<span style="color:darkred; font-weight:bold;">')
-      sb.write(input_sample.code_before_edit)
-      sb.write('</span>\n')
-      sb.write('<span style="color:darkgreen; font-weight:bold;">')
-      sb.write(input_sample.code_after_edit)
-      sb.write('</span>')
-      sb.write('</pre>\n<h4>Forward Samples</h4>\n')
-      sb.write('<ol>')
-      for sample in samples.generation_samples:
-        sb.write(
-            f'<li>{sample.forward_sample.text} '
-            f'({sample.forward_sample.logprob:.2f})</li>\n'
+    input_sample = samples.datapoint
+    forward_items = ''.join(
+        f'<li>{sample.forward_sample.text} '
+        f'({sample.forward_sample.logprob:.2f})</li>\n'
+        for sample in samples.generation_samples
+    )
+    backward_rows = ''.join(
+        f'<tr><td>{i}</td>\n'
+        + ''.join(
+            f'<td><pre> {bw_sample.text}</pre>'
+            f' <br/>({bw_sample.logprob:.2f})</td>'
+            for bw_sample in sample.backward_samples
         )
-      sb.write('</ol>\n')
-
-      sb.write('<h4>Backwards Samples</h4>\n<table>')
-      for i, sample in enumerate(samples.generation_samples, start=1):
-        sb.write(f'<tr><td>{i}</td>\n')
-        for bw_sample in sample.backward_samples:
-          sb.write(
-              f'<td><pre> {bw_sample.text}</pre>'
-              f' <br/>({bw_sample.logprob:.2f})</td>'
-          )
-        sb.write('</tr>\n')
-
-      sb.write('</table>\n')
-      return sb.getvalue()
+        + '</tr>\n'
+        for i, sample in enumerate(samples.generation_samples, start=1)
+    )
+    return (
+        f'<h2>{input_sample.filename}</h2>\n'
+        '<pre>\n'
+        '<span style="color:darkred; font-weight:bold;">'
+        f'{input_sample.code_before_edit}</span>\n'
+        '<span style="color:darkgreen; font-weight:bold;">'
+        f'{input_sample.code_after_edit}</span>'
+        '</pre>\n<h4>Forward Samples</h4>\n'
+        f'<ol>{forward_items}</ol>\n'
+        f'<h4>Backwards Samples</h4>\n<table>{backward_rows}</table>\n'
+    )
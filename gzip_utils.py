@@ -0,0 +1,159 @@
+# Copyright 2024 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Utilities for reading and writing gzipped (JSONL) files."""
+
+from collections.abc import Iterator
+import contextlib
+import gzip
+import io
+import os
+from typing import BinaryIO, Final
+
+try:
+  # ISA-L's gzip implementation is a drop-in replacement and several times
+  # faster than the zlib-based one in the standard library.
+  from isal import igzip as _gzip  # pylint: disable=g-import-not-at-top
+except ImportError:
+  _gzip = gzip
+
+try:
+  # Decompresses in a separate thread, in parallel to the processing of the
+  # decompressed data. Only available in recent versions of ISA-L's bindings.
+  from isal import igzip_threaded as _gzip_threaded  # pylint: disable=g-import-not-at-top
+except ImportError:
+  _gzip_threaded = None
+
+# The size of the buffers around the (de)compressor. Batching small reads and
+# writes into large blocks amortizes the per-call overhead of the
+# (de)compressor.
+_BUFFER_SIZE: Final[int] = 128 * 1024
+
+# The size of the decompressed blocks read when iterating over lines.
+_READ_BLOCK_SIZE: Final[int] = 1024 * 1024
+
+# Decompressing in a separate thread only pays off if it can run in parallel.
+_DECOMPRESS_IN_THREAD: Final[bool] = (
+    _gzip_threaded is not None and (os.cpu_count() or 1) > 1
+)
+
+# Favor throughput over compression ratio. The outputs are intermediate files.
+_COMPRESS_LEVEL: Final[int] = 1
+
+
+@contextlib.contextmanager
+def open_read(path: str) -> Iterator[BinaryIO]:
+  """Opens a gzip file for reading.
+
+  Args:
+    path: The path of the file.
+
+  Yields:
+    A binary file object with the decompressed contents of the file.
+  """
+  if _DECOMPRESS_IN_THREAD:
+    with _gzip_threaded.open(
+        path, "rb", threads=1, block_size=_READ_BLOCK_SIZE
+    ) as f:
+      yield f
+  else:
+    with (
+        open(path, "rb", buffering=_BUFFER_SIZE) as raw_f,
+        _gzip.GzipFile(fileobj=raw_f, mode="rb") as gzip_f,
+        io.BufferedReader(gzip_f, buffer_size=_BUFFER_SIZE) as f,
+    ):
+      yield f
+
+
+class _FlushingBufferedWriter(io.BufferedWriter):
+  """A buffered writer whose `flush` also flushes the underlying stream."""
+
+  def flush(self) -> None:
+    super().flush()
+    self.raw.flush()
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+  """Iterates over the lines of a gzip file.
+
+  The file is decompressed in large blocks which are split into lines at once,
+  which is considerably faster than iterating over the file object line by
+  line.
+
+  Args:
+    path: The path of the file.
+
+  Yields:
+    The lines of the file, without the trailing new line.
+  """
+  with open_read(path) as f:
+    partial = b""
+    while block := f.read(_READ_BLOCK_SIZE):
+      lines = (partial + block).split(b"\n")
+      partial = lines.pop()
+      yield from lines
+    if partial:
+      yield partial
+
+
+@contextlib.contextmanager
+def open_write(path: str, append: bool = False) -> Iterator[BinaryIO]:
+  """Opens a gzip file for writing.
+
+  Args:
+    path: The path of the file.
+    append: If true, a new gzip member is appended to an existing file.
+
+  Yields:
+    A binary file object that compresses all written data. Calling `flush` on
+    it writes all data written so far to the file.
+  """
+  with (
+      open(path, "ab" if append else "wb", buffering=_BUFFER_SIZE) as raw_f,
+      _gzip.GzipFile(
+          fileobj=raw_f, mode="wb", compresslevel=_COMPRESS_LEVEL
+      ) as gzip_f,
+      _FlushingBufferedWriter(gzip_f, buffer_size=_BUFFER_SIZE) as f,
+  ):
+    yield f
+
+
+def drop_truncated_tail(path: str) -> None:
+  """Drops the truncated end of a gzip file, e.g. left by an interrupted write.
+
+  The file is rewritten with all the complete lines that can be decompressed.
+
+  Args:
+    path: The path of the file.
+  """
+  tmp_path = f"{path}.tmp"
+  with (
+      open(path, "rb", buffering=_BUFFER_SIZE) as raw_f,
+      # The standard library implementation is used on purpose: its `read1`
+      # returns the data decompressed so far, instead of raising an error,
+      # before reaching the truncated end.
+      gzip.GzipFile(fileobj=raw_f, mode="rb") as in_f,
+      open_write(tmp_path) as out_f,
+  ):
+    partial = b""
+    try:
+      while block := in_f.read1(_BUFFER_SIZE):
+        block = partial + block
+        lines_end = block.rfind(b"\n") + 1
+        out_f.write(block[:lines_end])
+        partial = block[lines_end:]
+    except EOFError:
+      pass
+  os.replace(tmp_path, path)
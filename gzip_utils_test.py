@@ -0,0 +1,91 @@
+# Copyright 2024 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for gzip_utils."""
+import os
+import zlib
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from roundtrip_correctness import gzip_utils
+
+
+class GzipUtilsTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      dict(testcase_name="empty", contents=b"", expected_lines=[]),
+      dict(
+          testcase_name="trailing_new_line",
+          contents=b"a\nbc\n\nd\n",
+          expected_lines=[b"a", b"bc", b"", b"d"],
+      ),
+      dict(
+          testcase_name="no_trailing_new_line",
+          contents=b"a\nbc",
+          expected_lines=[b"a", b"bc"],
+      ),
+      dict(
+          testcase_name="lines_across_blocks",
+          contents=b"x" * 3_000_000 + b"\n" + b"y\n" * 1_000_000,
+          expected_lines=[b"x" * 3_000_000] + [b"y"] * 1_000_000,
+      ),
+  )
+  def test_iter_lines(self, contents: bytes, expected_lines: list[bytes]):
+    path = os.path.join(self.create_tempdir().full_path, "test.jsonl.gz")
+    with gzip_utils.open_write(path) as f:
+      f.write(contents)
+
+    self.assertEqual(list(gzip_utils.iter_lines(path)), expected_lines)
+
+  def test_append_adds_gzip_member(self):
+    path = os.path.join(self.create_tempdir().full_path, "test.jsonl.gz")
+    with gzip_utils.open_write(path) as f:
+      f.write(b"a\n")
+    with gzip_utils.open_write(path, append=True) as f:
+      f.write(b"b\n")
+
+    with gzip_utils.open_read(path) as f:
+      self.assertEqual(f.read(), b"a\nb\n")
+
+  def test_flush_writes_to_file(self):
+    path = os.path.join(self.create_tempdir().full_path, "test.jsonl.gz")
+    with gzip_utils.open_write(path) as f:
+      f.write(b"a\n")
+      f.flush()
+      with open(path, "rb") as raw_f:
+        decompressor = zlib.decompressobj(wbits=31)
+        self.assertEqual(decompressor.decompress(raw_f.read()), b"a\n")
+
+  def test_drop_truncated_tail(self):
+    path = os.path.join(self.create_tempdir().full_path, "test.jsonl.gz")
+    with gzip_utils.open_write(path) as f:
+      f.write(b"a\nb\n")
+    with gzip_utils.open_write(path, append=True) as f:
+      f.write(b"c\n" * 1000)
+    with open(path, "r+b") as f:
+      f.truncate(os.path.getsize(path) - 10)
+    with self.assertRaises(EOFError):
+      list(gzip_utils.iter_lines(path))
+
+    gzip_utils.drop_truncated_tail(path)
+
+    lines = list(gzip_utils.iter_lines(path))
+    self.assertEqual(lines[:2], [b"a", b"b"])
+    self.assertTrue(all(line == b"c" for line in lines[2:]))
+
+
+if __name__ == "__main__":
+  absltest.main()
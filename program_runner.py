@@ -15,8 +15,10 @@
 
 """Utility class to run operations on a program."""
 
+import concurrent.futures
 import contextlib
 import dataclasses
+import itertools
 import os
 import shutil
 import tarfile
@@ -25,13 +27,44 @@ import tempfile
 from absl import flags
 from absl import logging
 import docker
-import requests
+
+from roundtrip_correctness import gzip_utils
 
 
 _DOCKER_RUNTIME = flags.DEFINE_string(
     "docker_runtime", "runc", "The docker runtime."
 )
 
+_WORKING_DIR_BASE = flags.DEFINE_string(
+    "working_dir_base",
+    None,
+    "The directory in which the working copies of the code are created, e.g."
+    " a tmpfs such as /dev/shm to keep the per-run resets off the disk."
+    " Defaults to the system temporary directory.",
+)
+
+
+# The number of threads used to delete the contents of the working directory.
+_NUM_DELETION_THREADS = 8
+
+# The exit code of `timeout` when the command timed out.
+_TIMEOUT_EXIT_CODE = 124
+
+# The time after which a timed out operation that ignores SIGTERM is killed.
+_KILL_GRACE_SEC = 10
+
+
+def _raise_error(error: OSError) -> None:
+  raise error
+
+
+def _remove_path(path: str) -> None:
+  """Removes a file, a link or a directory tree."""
+  if os.path.isfile(path) or os.path.islink(path):
+    os.unlink(path)
+  elif os.path.isdir(path):
+    shutil.rmtree(path)
+
 
 @dataclasses.dataclass(frozen=True)
 class RunInfo:
@@ -42,95 +75,154 @@ class RunInfo:
 
 
 class ProgramRunner:
-  """Utility class to run a program."""
-
-  def __init__(self, code_tar_path: str, docker_image: str):
+  """Utility class to run a program.
+
+  All operations of a runner are executed in a single long-lived container,
+  which is started on the first run and kept alive until the runner is closed.
+  This avoids paying the container start-up cost for every run. All processes
+  left behind by a run are killed when it ends, so that they cannot affect the
+  next runs.
+
+  Since the memory limit applies to the container, it is set once per runner
+  rather than per run. The runs of a runner are executed one at a time, so the
+  limit still bounds the memory of each run.
+  """
+
+  def __init__(
+      self, code_tar_path: str, docker_image: str, mem_limit: str = "10g"
+  ):
     self._code_tar_path = code_tar_path
-    self._working_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+    self._working_dir = tempfile.TemporaryDirectory(
+        dir=_WORKING_DIR_BASE.value, ignore_cleanup_errors=True
+    )
+    self._outputs_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+    self._op_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
     self._docker_client = docker.DockerClient.from_env()
     self._docker_image = docker_image
+    self._mem_limit = mem_limit
+    self._container = None
     self.reset_code_dir()
 
-  def reset_code_dir(self) -> None:
-    """Ensures that the working dir contains the original state of the repo."""
-
-    # Delete all contents
-    for filename in os.listdir(self._working_dir.name):
-      file_path = os.path.join(self._working_dir.name, filename)
-      if os.path.isfile(file_path) or os.path.islink(file_path):
-        os.unlink(file_path)
-      elif os.path.isdir(file_path):
-        shutil.rmtree(file_path)
-
-    # Re-extract tar.gz
-    with tarfile.open(os.path.join(self._code_tar_path), "r:gz") as tar:
-      tar.extractall(self._working_dir.name)
-
-  @property
-  def code_dir(self) -> str:
-    return self._working_dir.name
+  def __enter__(self) -> "ProgramRunner":
+    return self
 
-  def _cleanup_temp_files(self) -> None:
-    self._docker_client.containers.run(
-        image=self._docker_image,
-        command="chmod -R 777 /code/",
-        volumes={
-            self._working_dir.name: {"bind": "/code/", "mode": "rw"},
-        },
-        network_disabled=True,
-        runtime=_DOCKER_RUNTIME.value,
-        detach=False,
-        remove=True,
-    )
+  def __exit__(self, *exc_info) -> None:
+    self.close()
 
-  @contextlib.contextmanager
-  def run(self, script: str, timeout_sec: int = 600, mem_limit: str = "10g"):
-    """Run an operation on the program."""
-    with (
-        tempfile.TemporaryDirectory() as outputs_tmpdir,
-        tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as op_tmpdir,
-    ):
-      with open(os.path.join(op_tmpdir, "run.sh"), "w") as f:
-        f.write(script)
-
-      container = self._docker_client.containers.run(
+  def close(self) -> None:
+    """Stops the container of the runner and deletes its files."""
+    if self._container is not None:
+      try:
+        self._container.remove(force=True)
+      except docker.errors.APIError:
+        logging.exception("Could not stop or remove container.")
+      self._container = None
+    for tmp_dir in (self._working_dir, self._outputs_dir, self._op_dir):
+      tmp_dir.cleanup()
+
+  def _get_container(self) -> docker.models.containers.Container:
+    """Returns the container of the runner, starting it if needed."""
+    if self._container is None:
+      self._container = self._docker_client.containers.run(
           image=self._docker_image,
-          command="sh /op/run.sh",
+          command="sleep infinity",
           volumes={
               self._working_dir.name: {"bind": "/code/", "mode": "rw"},
-              outputs_tmpdir: {"bind": "/outputs/", "mode": "rw"},
-              op_tmpdir: {"bind": "/op/", "mode": "ro"},
+              self._outputs_dir.name: {"bind": "/outputs/", "mode": "rw"},
+              self._op_dir.name: {"bind": "/op/", "mode": "ro"},
           },
           network_disabled=True,
-          stderr=True,
-          stdout=True,
           runtime=_DOCKER_RUNTIME.value,
           detach=True,
-          mem_limit=mem_limit,
+          mem_limit=self._mem_limit,
           nano_cpus=1_000_000_000 * 2,  # 2 CPUs per run.
       )
-      try:
-        exit_info = str(container.wait(timeout=timeout_sec))
-      except requests.exceptions.ConnectionError:
-        exit_info = "Timeout: Container stopped."
-        container.pause()
-
-      stdout_log = container.logs(stderr=False, stdout=True).decode()
-      stderr_log = container.logs(stderr=True, stdout=False).decode()
+    return self._container
 
-      try:
-        container.stop()
-        container.remove(force=True)
-      except docker.errors.APIError:
-        logging.exception("Could not stop or remove container.")
+  def reset_code_dir(self) -> None:
+    """Ensures that the working dir contains the original state of the repo."""
 
-      yield RunInfo(
-          stdout_log=stdout_log,
-          stderr_log=stderr_log,
-          exit_info=exit_info,
-          output_path=outputs_tmpdir,
+    # Delete all contents. Deleting many small files is bound by the latency
+    # of the filesystem calls, which overlap well across threads.
+    dir_name = self._working_dir.name
+    with concurrent.futures.ThreadPoolExecutor(
+        _NUM_DELETION_THREADS
+    ) as executor:
+      # Consume the results to propagate any errors.
+      list(
+          executor.map(
+              _remove_path,
+              [os.path.join(dir_name, f) for f in os.listdir(dir_name)],
+          )
       )
-      try:
-        self._cleanup_temp_files()
-      except PermissionError:
-        logging.exception("Could not cleanup temp files.")
+
+    # Re-extract tar.gz. Streaming mode reads the archive sequentially, so
+    # it is decompressed only once, through large buffers.
+    with (
+        gzip_utils.open_read(self._code_tar_path) as f,
+        tarfile.open(fileobj=f, mode="r|") as tar,
+    ):
+      tar.extractall(self._working_dir.name)
+
+  @property
+  def code_dir(self) -> str:
+    return self._working_dir.name
+
+  def _cleanup_temp_files(self) -> None:
+    """Makes all files in the working dir modifiable by the host."""
+    try:
+      os.chmod(self._working_dir.name, 0o777)
+      for root, dirs, files in os.walk(
+          self._working_dir.name, onerror=_raise_error
+      ):
+        for name in itertools.chain(dirs, files):
+          path = os.path.join(root, name)
+          if not os.path.islink(path):
+            os.chmod(path, 0o777)
+    except PermissionError:
+      # Files created by the container as a different user can only be changed
+      # from within a container.
+      self._cleanup_temp_files_in_container()
+
+  def _cleanup_temp_files_in_container(self) -> None:
+    self._get_container().exec_run(["chmod", "-R", "777", "/code/"])
+
+  @contextlib.contextmanager
+  def run(self, script: str, timeout_sec: int = 600):
+    """Run an operation on the program."""
+    with open(os.path.join(self._op_dir.name, "run.sh"), "w") as f:
+      f.write(script)
+
+    container = self._get_container()
+    # Clear the outputs of the previous run. These are owned by the user of the
+    # container, so they need to be removed from within the container.
+    container.exec_run(["sh", "-c", "rm -rf /outputs/* /outputs/.[!.]*"])
+    exit_code, (stdout, stderr) = container.exec_run(
+        [
+            "timeout",
+            "-k",
+            str(_KILL_GRACE_SEC),
+            str(timeout_sec),
+            "sh",
+            "/op/run.sh",
+        ],
+        demux=True,
+    )
+    # Kill the processes left behind, e.g. servers started by the tests. This
+    # spares the container's init process and the shell running `kill`.
+    container.exec_run(["sh", "-c", "kill -9 -1 2>/dev/null"])
+    if exit_code == _TIMEOUT_EXIT_CODE:
+      exit_info = "Timeout: Container stopped."
+    else:
+      exit_info = str({"Error": None, "StatusCode": exit_code})
+
+    yield RunInfo(
+        stdout_log=(stdout or b"").decode(),
+        stderr_log=(stderr or b"").decode(),
+        exit_info=exit_info,
+        output_path=self._outputs_dir.name,
+    )
+    try:
+      self._cleanup_temp_files()
+    except PermissionError:
+      logging.exception("Could not cleanup temp files.")
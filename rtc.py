@@ -15,24 +15,32 @@
 
 """Loader for running RTC Evaluation."""
 
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 import contextlib
-import gzip
+import dataclasses
+import functools
 import hashlib
 import os
-from typing import AsyncIterator, Type, TypeVar
+from typing import Any, AsyncIterator, Type, TypeVar
 
 from absl import logging
 import dataclasses_json
 import gin
+import orjson
 import tqdm.asyncio as tqdm
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness import rtc_data as rtcd
 from roundtrip_correctness import rtc_task as rtct
 
 
 _T = TypeVar("_T")
 
+# The number of generated samples after which the outputs are flushed. Flushing
+# the gzip stream after every sample degrades compression and is slow, but
+# outputs should still regularly be persisted for resuming.
+_FLUSH_EVERY_N_SAMPLES = 32
+
 
 async def _to_tuple_iter(
     data: AsyncIterator[_T], as_first_element: bool
@@ -44,8 +52,69 @@ async def _to_tuple_iter(
       yield (None, s)
 
 
-def _compute_hash(json_str) -> str:
-  return hashlib.sha256(json_str.encode()).hexdigest()
+@functools.cache
+def _make_normalizer(
+    cls: Type[_T],
+) -> Callable[[dict[str, Any]], dict[str, Any]]:
+  """Makes a normalizer of json-decoded datapoints for de-duplication.
+
+  The normalized dict has exactly the init fields of `cls`, with the defaults
+  filled in, like the datapoint decoded into `cls` would. Thus, inputs that
+  omit defaulted fields or carry extra keys normalize to the same dict as the
+  datapoints of the outputs, without building a dataclass. Only the top-level
+  fields are normalized.
+
+  Args:
+    cls: The dataclass of the datapoints.
+
+  Returns:
+    A function that normalizes a json-decoded datapoint.
+  """
+  field_names = []
+  defaults = {}
+  for field in dataclasses.fields(cls):
+    # Fields that are not init fields are derived from the others.
+    if not field.init:
+      continue
+    field_names.append(field.name)
+    if field.default is not dataclasses.MISSING:
+      defaults[field.name] = field.default
+    elif field.default_factory is not dataclasses.MISSING:
+      defaults[field.name] = field.default_factory()
+
+  def normalize(d: dict[str, Any]) -> dict[str, Any]:
+    with_defaults = defaults | d
+    return {name: with_defaults[name] for name in field_names}
+
+  return normalize
+
+
+def _compute_hash(datapoint: dict[str, Any]) -> int:
+  """Computes a hash of a normalized datapoint, independent of key order.
+
+  The hash is a 64-bit integer, which is compact to store for large datasets
+  while still making collisions unlikely for up to millions of datapoints.
+
+  Args:
+    datapoint: The datapoint, as normalized by `_make_normalizer`.
+
+  Returns:
+    The hash of the datapoint.
+  """
+  return int.from_bytes(
+      hashlib.blake2b(
+          orjson.dumps(datapoint, option=orjson.OPT_SORT_KEYS), digest_size=8
+      ).digest()
+  )
+
+
+def _iter_generated_hashes(
+    generation_output_filepath: str,
+    normalize_datapoint: Callable[[dict[str, Any]], dict[str, Any]],
+) -> Iterator[int]:
+  """Iterates over the hashes of the datapoints with generated samples."""
+  for line in gzip_utils.iter_lines(generation_output_filepath):
+    yield _compute_hash(normalize_datapoint(orjson.loads(line)["datapoint"]))
 
 
 @gin.configurable
@@ -70,31 +139,42 @@ async def run(
   input_data_class: Type[dataclasses_json.DataClassJsonMixin] = task.input_type
   generation_output_filepath = output_data_path + "-generation.jsonl.gz"
 
-  seen_samples: set[str] = set()
-
-  def _add_datapoint(d) -> None:
-    seen_samples.add(_compute_hash(input_data_class.from_dict(d).to_json()))
+  normalize_datapoint = _make_normalizer(input_data_class)
+  seen_samples: set[int] = set()
 
   if os.path.exists(generation_output_filepath):
-    with gzip.open(open(generation_output_filepath, "rb")) as f:
-      for line in f:
-        _add_datapoint(
-            rtcd.GenerationSamplesForDatapoint.from_json(
-                line.decode()
-            ).datapoint
-        )
+    try:
+      seen_samples.update(
+          _iter_generated_hashes(
+              generation_output_filepath, normalize_datapoint
+          )
+      )
+    except EOFError:
+      # Appending to a truncated gzip file would make the rest of the output
+      # unreadable, so the incomplete end is dropped first.
+      logging.warning(
+          "%s is truncated, likely by an interrupted run. Dropping its end.",
+          generation_output_filepath,
+      )
+      gzip_utils.drop_truncated_tail(generation_output_filepath)
+      seen_samples = set(
+          _iter_generated_hashes(
+              generation_output_filepath, normalize_datapoint
+          )
+      )
     logging.info(
         "Resuming: Found %d existing samples in %s",
         len(seen_samples),
         generation_output_filepath,
     )
 
+  decode_datapoint = rtcd.make_decoder(input_data_class)
+
   def _dataset_iter() -> Iterator[dataclasses_json.DataClassJsonMixin]:
-    with gzip.open(open(input_data_path, "rb")) as f:
-      for line in f:
-        datapoint = input_data_class.from_json(line.decode())
-        if _compute_hash(datapoint.to_json()) not in seen_samples:
-          yield datapoint
+    for line in gzip_utils.iter_lines(input_data_path):
+      datapoint = orjson.loads(line)
+      if _compute_hash(normalize_datapoint(datapoint)) not in seen_samples:
+        yield decode_datapoint(datapoint)
 
   if html_output_file:
     html_ctx_manager = open(html_output_file, "a")
@@ -102,19 +182,28 @@ async def run(
     html_ctx_manager = contextlib.nullcontext()
 
   with (
-      gzip.open(open(generation_output_filepath, "ab"), "a") as f_gen,
+      gzip_utils.open_write(generation_output_filepath, append=True) as f_gen,
       html_ctx_manager as f_html,
   ):
+    num_unflushed_samples = 0
     async for generation_sample in tqdm.tqdm(
         task.generate_rtc_samples(_dataset_iter()),
         initial=len(seen_samples),
+        mininterval=1.0,
+        # Disables the progress bar when not writing to a terminal.
+        disable=None,
     ):
-
+      num_unflushed_samples += 1
       if f_gen:
-        f_gen.write(generation_sample.to_json().encode())
-        f_gen.write(b"\n")
-        f_gen.flush()
+        f_gen.write(
+            orjson.dumps(generation_sample, option=orjson.OPT_APPEND_NEWLINE)
+        )
         if f_html:
           f_html.write(task.samples_to_html(generation_sample))
           f_html.write("\n")
+
+      if num_unflushed_samples >= _FLUSH_EVERY_N_SAMPLES:
+        f_gen.flush()
+        if f_html:
           f_html.flush()
+        num_unflushed_samples = 0
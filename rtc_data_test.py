@@ -0,0 +1,109 @@
+# Copyright 2024 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for rtc_data."""
+
+import dataclasses
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from roundtrip_correctness import rtc_data
+
+
+@dataclasses.dataclass
+class _Datapoint:
+  filename: str
+  span: tuple[int, int]
+  num_lines: int = dataclasses.field(init=False)
+  description: str | None = None
+
+  def __post_init__(self):
+    self.num_lines = self.span[1] - self.span[0]
+
+
+def _make_evaluated_samples(
+    with_baseline: bool,
+) -> rtc_data.EvaluatedGenerationSamplesForDatapoint:
+  baseline_samples = [rtc_data.Sample("baseline", -0.5)]
+  return rtc_data.EvaluatedGenerationSamplesForDatapoint(
+      samples=rtc_data.GenerationSamplesForDatapoint(
+          datapoint={"filename": "foo.py::1", "code": "x = 1"},
+          generation_samples=[
+              rtc_data.GenerationSample(
+                  forward_sample=rtc_data.Sample("forward", -1.0),
+                  backward_samples=[
+                      rtc_data.Sample("backward1", -2.0),
+                      rtc_data.Sample("backward2", 0.0),
+                  ],
+              )
+          ],
+          baseline_samples=baseline_samples if with_baseline else None,
+      ),
+      generation_samples_consistencies={"exact_match": [[1.0, 0.0]]},
+      baseline_samples_consistencies=(
+          {"exact_match": [1.0]} if with_baseline else None
+      ),
+  )
+
+
+class RtcDataTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      dict(testcase_name="with_baseline", with_baseline=True),
+      dict(testcase_name="without_baseline", with_baseline=False),
+  )
+  def test_evaluated_generation_samples_from_dict(self, with_baseline):
+    json_dict = _make_evaluated_samples(with_baseline).to_dict()
+
+    expected = rtc_data.EvaluatedGenerationSamplesForDatapoint.from_dict(
+        json_dict
+    )
+    expected.samples = rtc_data.GenerationSamplesForDatapoint.from_dict(
+        expected.samples
+    )
+    self.assertEqual(
+        rtc_data.evaluated_generation_samples_from_dict(json_dict), expected
+    )
+
+  def test_generation_samples_from_dict_validates_samples(self):
+    json_dict = _make_evaluated_samples(with_baseline=True).samples.to_dict()
+    json_dict["baseline_samples"][0]["logprob"] = 1.0
+
+    with self.assertRaises(ValueError):
+      rtc_data.generation_samples_from_dict(json_dict)
+
+  def test_compute_scores_rejects_missing_generation_sample_evals(self):
+    evaluated_samples = _make_evaluated_samples(with_baseline=False)
+    evaluated_samples.generation_samples_consistencies["exact_match"] = []
+
+    with self.assertRaises(ValueError):
+      evaluated_samples.compute_scores()
+
+  def test_make_decoder(self):
+    decode = rtc_data.make_decoder(_Datapoint)
+
+    self.assertEqual(
+        decode({"filename": "foo.py", "span": [1, 3], "num_lines": 5}),
+        _Datapoint("foo.py", (1, 3)),
+    )
+    self.assertEqual(
+        decode({"filename": "foo.py", "span": [1, 3], "extra": "bar"}),
+        _Datapoint("foo.py", (1, 3)),
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -20,7 +20,6 @@ from __future__ import annotations
 import abc
 import asyncio
 from collections.abc import Collection, Iterator
-import io
 import typing
 from typing import AsyncIterator, Final, Generic, Type, TypeVar, final
 
@@ -39,6 +38,9 @@ _LOG_PROMPTS_AND_RESPONSES = flags.DEFINE_string(
 
 _TInput = TypeVar('_TInput', bound=dataclasses_json.DataClassJsonMixin)
 
+# Sentinel marking the end of the input data.
+_END_OF_INPUT: Final[object] = object()
+
 
 class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
   """An abstract class for roundtrip correctness evaluation tasks.
@@ -85,9 +87,9 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
     self._max_backward_generation_len = max_backward_generation_len
 
     self._example_separator: Final[str] = example_separator_token
-    self._stopping_tokens: Final[set[str]] = set(stopping_tokens) | {
-        example_separator_token
-    }
+    self._stopping_tokens: Final[frozenset[str]] = frozenset(
+        stopping_tokens
+    ) | {example_separator_token}
 
     self._forward_prompt_prefix: Final[str] = (
         self._render_forward_prompt_prefix(
@@ -107,6 +109,10 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
     # long time until the first full end-to-end sample is fully
     # generated.
     self._max_concurrent_examples = asyncio.Semaphore(max_concurrent_examples)
+    # The maximum number of examples scheduled at any time. Scheduling more
+    # examples than can be computed concurrently keeps the semaphore saturated,
+    # while bounding how much of the input is read ahead.
+    self._max_scheduled_examples: Final[int] = 2 * max_concurrent_examples
 
   input_type: Type[_TInput]
 
@@ -127,15 +133,14 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
       forward_few_shot_examples: Collection[_TInput],
   ) -> str:
     """Renders the string for the few-shot prefix of the prompt."""
-    with io.StringIO() as sb:
-      if forward_prompt_instruction:
-        sb.write(forward_prompt_instruction)
-        sb.write('\n')
-      for example in forward_few_shot_examples:
-        context, target = self._format_datapoint_for_forward(example)
-        sb.write(f'{context} {target}{self._example_separator}')
+    parts = []
+    if forward_prompt_instruction:
+      parts += (forward_prompt_instruction, '\n')
+    for example in forward_few_shot_examples:
+      context, target = self._format_datapoint_for_forward(example)
+      parts.append(f'{context} {target}{self._example_separator}')
 
-      return sb.getvalue()
+    return ''.join(parts)
 
   @final
   def _format_forward_prompt(self, datapoint: _TInput) -> rtcd.PromptAndTarget:
@@ -176,15 +181,14 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
       backward_few_shot_examples: Collection[_TInput],
   ) -> str:
     """Renders the string for the few-shot prefix of the prompt."""
-    with io.StringIO() as sb:
-      if backward_prompt_instruction:
-        sb.write(backward_prompt_instruction)
-        sb.write('\n')
-      for example in backward_few_shot_examples:
-        context, target = self._format_datapoint_for_backward(example)
-        sb.write(f'{context}{target}{self._example_separator}')
+    parts = []
+    if backward_prompt_instruction:
+      parts += (backward_prompt_instruction, '\n')
+    for example in backward_few_shot_examples:
+      context, target = self._format_datapoint_for_backward(example)
+      parts.append(f'{context}{target}{self._example_separator}')
 
-      return sb.getvalue()
+    return ''.join(parts)
 
   @final
   def _construct_backward_prompt(
@@ -200,9 +204,9 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
       The backward prompt, target (if known), and stopping token.
     """
 
-    eod_idx = forward_sampled_target.find(self._example_separator)
-    if eod_idx != -1:
-      forward_sampled_target = forward_sampled_target[:eod_idx]
+    forward_sampled_target = forward_sampled_target.partition(
+        self._example_separator
+    )[0]
 
     context, target = self._format_datapoint_for_backward(
         datapoint, forward_sampled_target
@@ -316,15 +320,40 @@ class RoundTripCorrectnessTask(Generic[_TInput], abc.ABC):
   ) -> AsyncIterator[rtcd.GenerationSamplesForDatapoint[_TInput]]:
     """Samples concurrently an LLM for RTC samples.
 
+    Datapoints are read from the input lazily, such that only a bounded number
+    of them is scheduled at any time.
+
     Args:
       input_data: The input data iterator.
 
     Yields:
       The RTC samples.
     """
-    all_tasks = [self._get_samples_for(datapoint) for datapoint in input_data]
-    for samples in asyncio.as_completed(all_tasks):
-      yield await samples
+    pending = set()
+    input_data = iter(input_data)
+    input_exhausted = False
+    try:
+      while True:
+        while (
+            not input_exhausted
+            and len(pending) < self._max_scheduled_examples
+        ):
+          datapoint = next(input_data, _END_OF_INPUT)
+          if datapoint is _END_OF_INPUT:
+            input_exhausted = True
+          else:
+            pending.add(asyncio.create_task(self._get_samples_for(datapoint)))
+        if not pending:
+          return
+
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+          yield task.result()
+    finally:
+      for task in pending:
+        task.cancel()
 
   @classmethod
   @abc.abstractmethod
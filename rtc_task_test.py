@@ -138,6 +138,28 @@ class RTCTaskTest(absltest.TestCase, unittest.IsolatedAsyncioTestCase):
           ],
       )
 
+  async def test_generation_of_many_datapoints(self):
+    fw_prompt_mock, bw_prompt_mock = _create_llm_mock()
+
+    task = _RTCTaskStub(
+        lambda: fw_prompt_mock,
+        lambda: bw_prompt_mock,
+        n_forward_samples=3,
+        n_backward_samples=2,
+        max_forward_generation_len=100,
+        max_backward_generation_len=101,
+        forward_prompt_instruction='',
+        backward_prompt_instruction='',
+        forward_few_shot_examples=(),
+        backward_few_shot_examples=(),
+        example_separator_token='\n',
+        max_concurrent_examples=2,
+    )
+    datapoints = [f'D{i}' for i in range(20)]
+    samples = [s async for s in task.generate_rtc_samples(iter(datapoints))]
+
+    self.assertCountEqual([s.datapoint for s in samples], datapoints)
+
 
 if __name__ == '__main__':
   absltest.main()
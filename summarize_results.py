@@ -17,17 +17,16 @@ r"""Summarize the RTC results."""
 
 import collections
 from collections.abc import Sequence
-import gzip
 import json
 import os
-from typing import Any
 
 from absl import app
 from absl import flags
-import numpy as np
+import orjson
 import rich.console
 import rich.table
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness import rtc_data as rtcd
 
 _INPUT_DATA_PATH = flags.DEFINE_string(
@@ -43,13 +42,17 @@ def main(argv: Sequence[str]) -> None:
     raise app.UsageError("Too many command-line arguments.")
 
   def example_to_group_id(example) -> str:
-    return example["filename"].split("::")[0]
+    return example["filename"].partition("::")[0]
 
   generation_path = _INPUT_DATA_PATH.value
 
-  per_group_stats = collections.defaultdict(
-      lambda: collections.defaultdict(list)
-  )
+  # The per-group stats are only kept if they are output.
+  if _OUTPUT_PER_EXAMPLE_STATS.value:
+    per_group_stats = collections.defaultdict(
+        lambda: collections.defaultdict(list)
+    )
+  else:
+    per_group_stats = None
 
   if not os.path.exists(generation_path):
     raise FileNotFoundError(f"{generation_path} does not exist.")
@@ -58,32 +61,32 @@ def main(argv: Sequence[str]) -> None:
   table.add_column("Name")
   table.add_column("Avg", justify="right")
 
-  generation_scores = collections.defaultdict(list)
-  with gzip.open(open(generation_path, "rb")) as f:
-    try:
-      for line in f:
-        sample: rtcd.EvaluatedGenerationSamplesForDatapoint[Any] = (
-            rtcd.EvaluatedGenerationSamplesForDatapoint.from_json(line.decode())
-        )
-        sample.samples = rtcd.GenerationSamplesForDatapoint.from_dict(
-            sample.samples
-        )
-        sample_scores = sample.compute_scores()
+  # The running sum and count of each metric, to compute their means.
+  metric_sums = collections.defaultdict(float)
+  metric_counts = collections.defaultdict(int)
+  try:
+    for line in gzip_utils.iter_lines(generation_path):
+      sample = rtcd.evaluated_generation_samples_from_dict(orjson.loads(line))
+      sample_scores = sample.compute_scores()
+      for metric_name, metric_value in sample_scores.items():
+        metric_sums[metric_name] += metric_value
+        metric_counts[metric_name] += 1
+      if per_group_stats is not None:
+        group_stats = per_group_stats[
+            example_to_group_id(sample.samples.datapoint)
+        ]
         for metric_name, metric_value in sample_scores.items():
-          generation_scores[metric_name].append(metric_value)
-          per_group_stats[example_to_group_id(sample.samples.datapoint)][
-              metric_name
-          ].append(metric_value)
-    except EOFError:
-      print("Could not load entire file.")
-
-  for metric_name, metric_values in generation_scores.items():
+          group_stats[metric_name].append(metric_value)
+  except EOFError:
+    print("Could not load entire file.")
+
+  for metric_name, metric_sum in metric_sums.items():
     table.add_row(
         metric_name,
-        f"{np.mean(metric_values):.3f}",
+        f"{metric_sum / metric_counts[metric_name]:.3f}",
     )
 
-  if _OUTPUT_PER_EXAMPLE_STATS.value:
+  if per_group_stats is not None:
     with open(_OUTPUT_PER_EXAMPLE_STATS.value, "w") as f:
       json.dump(per_group_stats, f)
 
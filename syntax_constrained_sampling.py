@@ -14,14 +14,12 @@
 # ==============================================================================
 
 """Syntax-constrained code span sampling for infilling-style tasks."""
-import collections
+import bisect
 from collections.abc import Callable, Iterator, Sequence
 import dataclasses
-import re
 from typing import Final
 
 from absl import logging
-import intervaltree
 import numpy as np
 import py_tree_sitter as ts
 
@@ -58,6 +56,7 @@ def sample(
     num_samples: int = 1,
     sample_with_replacement: bool = False,
     temperature: float = 0.8,
+    rng: np.random.Generator | None = None,
 ) -> Sequence[SampledSpan]:
   """Syntax-constrained code span sampling.
 
@@ -66,8 +65,8 @@ def sample(
   included characters. A bias towards longer sequences can be induced by
   decreasing the sampling temperature.
 
-  If randomness needs to be controlled, the np.seed must be set prior to
-  invoking this method.
+  If randomness needs to be controlled, either a seeded `rng` must be passed or
+  the np.seed must be set prior to invoking this method.
 
   Args:
     tree: The tree-sitter parsed tree
@@ -85,6 +84,8 @@ def sample(
       the longest permitted node will be returned. As this tends to +inf, the
       sample nodes will be selected uniformly at random independently of their
       length.
+    rng: The random generator to sample with. Defaults to NumPy's global random
+      state.
 
   Returns:
     A list of the sampled nodes.
@@ -109,13 +110,32 @@ def sample(
 
   eligible_nodes, weights = _weight_candidates(eligible_nodes, tree.text)
 
-  weights = weights ** (1 / temperature)
-  selected_nodes = np.random.choice(
-      eligible_nodes,
-      p=weights / weights.sum(),
-      size=min(num_samples, len(eligible_nodes)),
+  # The weights are raised to 1 / temperature in log-space, relative to the
+  # largest weight, which would otherwise overflow for small temperatures.
+  if temperature > 0:
+    with np.errstate(divide="ignore"):
+      log_weights = np.log(weights) / temperature
+    probs = np.exp(log_weights - log_weights.max())
+  else:
+    # In the limit, only the longest nodes are sampled.
+    probs = (weights == weights.max()).astype(np.float64)
+  probs /= probs.sum()
+
+  if sample_with_replacement:
+    num_selected = min(num_samples, len(eligible_nodes))
+  else:
+    # Nodes whose probability underflows to zero cannot be sampled.
+    num_selected = min(num_samples, np.count_nonzero(probs))
+  choice = np.random.choice if rng is None else rng.choice
+  # Sample indices, as sampling the nodes directly would first copy all of them
+  # into an array of objects.
+  selected_indices = choice(
+      len(eligible_nodes),
+      p=probs,
+      size=num_selected,
       replace=sample_with_replacement,
   )
+  selected_nodes = [eligible_nodes[i] for i in selected_indices]
 
   return [
       SampledSpan(n.start_byte, n.end_byte, n.start_point, n.end_point, n)
@@ -123,30 +143,23 @@ def sample(
   ]
 
 
-@dataclasses.dataclass(frozen=True, slots=True)
+@dataclasses.dataclass(slots=True)
 class _NodeGroup:
   """A group of consecutive syntax nodes, such as sequential statements.
 
+  Only the first and the last of the (more than 1) underlying nodes are kept,
+  along with the byte range of the group, which is accessed the most.
   Assumes input nodes are sorted and consecutive.
   """
 
-  nodes: Sequence[ts.Node]
-
-  def __post_init__(self):
-    if len(self.nodes) <= 1:
-      raise ValueError("Node group should have more than 1 underlying node")
-
-  @property
-  def start_byte(self) -> int:
-    return self.nodes[0].start_byte
-
-  @property
-  def end_byte(self) -> int:
-    return self.nodes[-1].end_byte
+  first_node: ts.Node
+  last_node: ts.Node
+  start_byte: int
+  end_byte: int
 
   @property
   def id(self) -> int:
-    return self.nodes[-1].id - self.nodes[0].id
+    return self.last_node.id - self.first_node.id
 
   @property
   def type(self) -> str:
@@ -154,35 +167,20 @@ class _NodeGroup:
 
   @property
   def start_point(self) -> tuple[int, int]:
-    return self.nodes[0].start_point
+    return self.first_node.start_point
 
   @property
   def end_point(self) -> tuple[int, int]:
-    return self.nodes[-1].end_point
+    return self.last_node.end_point
 
 
 _CandidateNode = ts.Node | _NodeGroup
 
 
-@dataclasses.dataclass(frozen=True)
-class _HashableNodeWrapper:
-  """A wrapper to make a tree-sitter node hashable via object identity.
-
-  This is required to store tree-sitter nodes to a dictionary.
-  """
-
-  node: _CandidateNode
-
-  def __hash__(self) -> int:
-    return self.node.id
-
-  def __eq__(self, other):
-    if not isinstance(other, _HashableNodeWrapper):
-      return False
-    return self.node is other.node
-
-
-_IS_WHITESPACE_RE: Final[re.Pattern[str]] = re.compile(r"\s+")
+# Whether each byte value is an ASCII whitespace character.
+_IS_WHITESPACE_BYTE: Final[np.ndarray] = np.array(
+    [bytes([b]).isspace() for b in range(256)]
+)
 
 
 def _weight_candidates(
@@ -200,54 +198,156 @@ def _weight_candidates(
 
   Note that whitespace is excluded from the length of each node.
 
+  The weights are computed on arrays without slicing the code: in O(L) for the
+  whitespace counts of the L bytes of code, and O(N log N) for sorting the
+  boundaries of the N candidates.
+
   Args:
-    candidate_nodes: An interval tree with the text span of CandidateNode to be
-      considered for sampling.
+    candidate_nodes: The CandidateNodes to be considered for sampling.
     code_bytes: The bytes of the code file.
 
   Returns:
-    A dictionary of each _CandidateNode with its length weight.
+    The candidate nodes and the length weight of each of them.
   """
-  nodes_interval_tree = intervaltree.IntervalTree()
-  for candidate_node in candidate_nodes:
-    nodes_interval_tree.addi(
-        candidate_node.start_byte, candidate_node.end_byte, candidate_node
-    )
+  # The number of whitespace bytes before each position of the code, such that
+  # the whitespace in any interval is counted in constant time.
+  num_whitespace_before = np.zeros(len(code_bytes) + 1, dtype=np.int64)
+  np.cumsum(
+      _IS_WHITESPACE_BYTE[np.frombuffer(code_bytes, dtype=np.uint8)],
+      out=num_whitespace_before[1:],
+  )
+
+  starts = np.fromiter(
+      (c.start_byte for c in candidate_nodes),
+      dtype=np.int64,
+      count=len(candidate_nodes),
+  )
+  ends = np.fromiter(
+      (c.end_byte for c in candidate_nodes),
+      dtype=np.int64,
+      count=len(candidate_nodes),
+  )
 
-  def _accu(
-      accumulator: list[_CandidateNode], node: _CandidateNode
-  ) -> list[_CandidateNode]:
-    accumulator.append(node)
-    return accumulator
+  # Sweep over the segments between consecutive start or end positions of the
+  # candidates. Each segment is overlapped by a fixed set of candidates.
+  boundaries = np.unique(np.concatenate((starts, ends)))
+  start_indices = np.searchsorted(boundaries, starts)
+  end_indices = np.searchsorted(boundaries, ends)
+  num_overlapping_candidates = np.cumsum(
+      np.bincount(start_indices, minlength=len(boundaries))
+      - np.bincount(end_indices, minlength=len(boundaries))
+  )[:-1]
+
+  # Each segment contributes its length equally to the candidates overlapping
+  # it.
+  segment_lengths = np.diff(boundaries) - np.diff(
+      num_whitespace_before[boundaries]
+  )
+  segment_weights = np.divide(
+      segment_lengths,
+      num_overlapping_candidates,
+      out=np.zeros(len(segment_lengths)),
+      where=num_overlapping_candidates > 0,
+  )
 
-  nodes_interval_tree.split_overlaps()
-  nodes_interval_tree.merge_overlaps(
-      data_reducer=_accu, data_initializer=list()
+  # The weight of a candidate is the sum of the weights of its segments.
+  cumulative_weights = np.zeros(len(boundaries))
+  np.cumsum(segment_weights, out=cumulative_weights[1:])
+  return (
+      candidate_nodes,
+      cumulative_weights[end_indices] - cumulative_weights[start_indices],
   )
 
-  candidate_weights = collections.defaultdict(float)
-  for interval in nodes_interval_tree:
-    interval: intervaltree.Interval
 
-    num_whitespace_chars = sum(
-        len(ws_span)
-        for ws_span in _IS_WHITESPACE_RE.findall(
-            code_bytes[interval.begin : interval.end].decode()
-        )
+def _iter_node_groups(
+    children: Sequence[ts.Node],
+    exclude_node_predicate: Predicate,
+    min_bytes_length: int,
+    max_bytes_length: int,
+) -> Iterator[_NodeGroup]:
+  """Yields the eligible sequences of nodes (groups) from the children."""
+  # The children are consecutive, so their end positions are sorted. The range
+  # of groups of appropriate length starting at each child is found by
+  # bisection, without constructing the groups outside of it.
+  ends = [c.end_byte for c in children]
+  for i, child_i in enumerate(children):
+    if exclude_node_predicate(child_i):
+      continue
+
+    start_byte = child_i.start_byte
+    # children[i:j] is longer than min_bytes_length from j_begin on, and not
+    # longer than max_bytes_length up to j_end.
+    j_begin = max(
+        i + 2,
+        bisect.bisect_right(ends, start_byte + min_bytes_length, lo=i) + 1,
     )
+    j_end = min(
+        len(children) - 1,
+        bisect.bisect_right(ends, start_byte + max_bytes_length, lo=i),
+    )
+    for j in range(j_begin, j_end + 1):
+      node_group = _NodeGroup(child_i, children[j - 1], start_byte, ends[j - 1])
+      if not exclude_node_predicate(node_group):
+        yield node_group
+
+
+def _walk_eligible_nodes(
+    tree: ts.Tree,
+    is_eligible_subtree_predicate: Predicate,
+    exclude_node_predicate: Predicate,
+    min_bytes_length: int,
+    max_bytes_length: int,
+) -> Sequence[_CandidateNode]:
+  """Visits all children in the tree with a cursor and retrieves eligible nodes.
 
-    candidates_in_interval: list[_CandidateNode] = interval.data
-    weighted_interval_length = (
-        interval.end - interval.begin - num_whitespace_chars
-    ) / len(candidates_in_interval)
+  A cursor keeps the traversal state in native memory, which is faster than
+  materializing the children of every visited node.
+  """
+  eligible_nodes = []
+  cursor = tree.walk()
+  # For each ancestor of the current node, whether it is in an eligible subtree
+  # and, if so, its children visited so far to form groups from.
+  ancestors: list[tuple[bool, list[ts.Node] | None]] = []
+  while True:
+    current_node = cursor.node
+    is_eligible_subtree = is_eligible_subtree_predicate(current_node)
+    if ancestors:
+      is_parent_eligible_subtree, siblings = ancestors[-1]
+      is_eligible_subtree |= is_parent_eligible_subtree
+      if siblings is not None:
+        siblings.append(current_node)
 
-    for candidate in candidates_in_interval:
-      candidate_weights[
-          _HashableNodeWrapper(candidate)
-      ] += weighted_interval_length
+    node_char_len = current_node.end_byte - current_node.start_byte
+    # Neither short nodes nor their children will be longer than
+    # min_char_length, so they are not descended into.
+    if node_char_len > min_bytes_length:
+      if (
+          node_char_len <= max_bytes_length
+          and is_eligible_subtree
+          and not exclude_node_predicate(current_node)
+      ):
+        eligible_nodes.append(current_node)
+
+      if cursor.goto_first_child():
+        # Do not sample groups of children of unsamplable nodes.
+        ancestors.append(
+            (is_eligible_subtree, [] if is_eligible_subtree else None)
+        )
+        continue
 
-  nodes_interval_tree, weights = zip(*candidate_weights.items())
-  return [c.node for c in nodes_interval_tree], np.array(weights)
+    while not cursor.goto_next_sibling():
+      if not cursor.goto_parent():
+        return eligible_nodes
+      _, children = ancestors.pop()
+      if children is not None:
+        eligible_nodes.extend(
+            _iter_node_groups(
+                children,
+                exclude_node_predicate,
+                min_bytes_length,
+                max_bytes_length,
+            )
+        )
 
 
 def _collect_eligible_nodes(
@@ -259,6 +359,15 @@ def _collect_eligible_nodes(
     max_bytes_length: int,
 ) -> Sequence[_CandidateNode]:
   """Visits the tree and retrieves all eligible nodes."""
+  if visit_children is visit_all_children:
+    return _walk_eligible_nodes(
+        tree,
+        is_eligible_subtree_predicate,
+        exclude_node_predicate,
+        min_bytes_length=min_bytes_length,
+        max_bytes_length=max_bytes_length,
+    )
+
   to_visit: list[tuple[ts.Node, bool]] = [(
       tree.root_node,
       is_eligible_subtree_predicate(tree.root_node),
@@ -292,19 +401,10 @@ def _collect_eligible_nodes(
 
     # Add sequences of nodes (groups) from the children (e.g., sequential
     # statements).
-    for i, child_i in enumerate(children):
-      if exclude_node_predicate(child_i):
-        continue
-
-      for j in range(i + 2, len(children)):
-        node_group = _NodeGroup(children[i:j])
-        node_group_len = node_group.end_byte - node_group.start_byte
-        if (
-            min_bytes_length < node_group_len <= max_bytes_length
-            and not exclude_node_predicate(node_group)
-        ):
-          eligible_nodes.append(node_group)
-        elif node_group_len > max_bytes_length:
-          break  # Do not expand group any further, it will be longer.
+    eligible_nodes.extend(
+        _iter_node_groups(
+            children, exclude_node_predicate, min_bytes_length, max_bytes_length
+        )
+    )
 
   return eligible_nodes
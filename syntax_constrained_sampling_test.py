@@ -19,6 +19,7 @@ from typing import Final
 
 from absl.testing import absltest
 import intervaltree
+import numpy as np
 
 from roundtrip_correctness import syntax_constrained_sampling
 from roundtrip_correctness import treesitter_utils
@@ -126,6 +127,46 @@ class SyntaxConstrainedSamplingTest(absltest.TestCase):
     # The excluded child nodes are _not_ present
     self.assertNotIn(b"-1", all_spans)
 
+  def test_sample_at_low_temperatures(self):
+    tree = treesitter_utils.parse_code(
+        _SAMPLE_CODE, treesitter_utils.SUFFIX_TO_TS_LANGUAGE["py"]
+    )
+    # The largest node is the whole module, with all non-whitespace chars.
+    (sampled_span,) = syntax_constrained_sampling.sample(
+        tree, _TRUE_PREDICATE, _FALSE_PREDICATE, temperature=0.0
+    )
+    self.assertEqual(sampled_span.start_pos, 0)
+    self.assertLen(_SAMPLE_CODE, sampled_span.end_pos)
+
+    # Raising the weights to large powers does not overflow.
+    sampled_spans = syntax_constrained_sampling.sample(
+        tree,
+        _TRUE_PREDICATE,
+        _FALSE_PREDICATE,
+        num_samples=3,
+        temperature=0.01,
+    )
+    self.assertLen(sampled_spans, 3)
+
+  def test_sample_with_seeded_rng(self):
+    tree = treesitter_utils.parse_code(
+        _SAMPLE_CODE, treesitter_utils.SUFFIX_TO_TS_LANGUAGE["py"]
+    )
+    sampled_spans = [
+        syntax_constrained_sampling.sample(
+            tree,
+            _TRUE_PREDICATE,
+            _FALSE_PREDICATE,
+            num_samples=5,
+            rng=np.random.default_rng(42),
+        )
+        for _ in range(2)
+    ]
+    self.assertEqual(
+        [(s.start_pos, s.end_pos) for s in sampled_spans[0]],
+        [(s.start_pos, s.end_pos) for s in sampled_spans[1]],
+    )
+
 
 if __name__ == "__main__":
   absltest.main()
@@ -17,15 +17,18 @@
 
 from collections.abc import Iterator, Sequence
 import concurrent
-import gzip
+import contextlib
 import json
 import os
+import queue
 import textwrap
 
 from absl import app
 from absl import flags
 from absl import logging
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness import program_runner
 from roundtrip_correctness import rtc_data as rtcd
 from roundtrip_correctness.synthesis_rtc import eval_utils
@@ -62,6 +65,10 @@ _RUN_COMMAND = flags.DEFINE_string(
 )
 
 
+# The number of backward samples of an example that are tested concurrently.
+_NUM_CONCURRENT_RUNS = 5
+
+
 def _get_pytest_summary(runner: program_runner.ProgramRunner) -> dict[str, int]:
   with runner.run(_RUN_COMMAND.value) as result:
     report_path = os.path.join(result.output_path, "pytest-report.json")
@@ -94,6 +101,7 @@ def prefix_and_suffix_for_example(
 
 
 def _compute_sample_pass(
+    runner_pool: queue.SimpleQueue[program_runner.ProgramRunner],
     filepath: str,
     prefix: str,
     suffix: str,
@@ -102,9 +110,6 @@ def _compute_sample_pass(
     bw_sample: str,
 ) -> bool:
   """Computes if unit tests still pass."""
-  runner = program_runner.ProgramRunner(
-      _TARGET_PROGRAM_TAR.value, _IMAGE_NAME.value
-  )
   bw_sample_text = textwrap.indent(
       textwrap.dedent(bw_sample),
       indentation,
@@ -112,9 +117,14 @@ def _compute_sample_pass(
   # Force-fix first line indentation
   bw_sample_text = indentation + bw_sample_text.lstrip()
 
-  with open(os.path.join(runner.code_dir, filepath), "w") as f:
-    f.write(f"{prefix}\n{bw_sample_text}\n{suffix}")
-  pytest_report = _get_pytest_summary(runner)
+  runner = runner_pool.get()
+  try:
+    runner.reset_code_dir()
+    with open(os.path.join(runner.code_dir, filepath), "w") as f:
+      f.write(f"{prefix}\n{bw_sample_text}\n{suffix}")
+    pytest_report = _get_pytest_summary(runner)
+  finally:
+    runner_pool.put(runner)
 
   # Note that this may be approximate. It is possible that this fixes
   # a test from the baseline causing another one to fail.
@@ -132,6 +142,8 @@ def _eval_sample(
         synthesis_rtc.SynthesisRtcExample
     ],
     baseline_pytest_report: dict[str, int],
+    reference_runner: program_runner.ProgramRunner,
+    runner_pool: queue.SimpleQueue[program_runner.ProgramRunner],
 ) -> (
     rtcd.EvaluatedGenerationSamplesForDatapoint[
         synthesis_rtc.SynthesisRtcExample
@@ -139,12 +151,9 @@ def _eval_sample(
     | None
 ):
   """Evaluates a single sample."""
-  runner = program_runner.ProgramRunner(
-      _TARGET_PROGRAM_TAR.value, _IMAGE_NAME.value
-  )
   try:
     filepath, prefix, suffix = prefix_and_suffix_for_example(
-        input_example.datapoint, runner
+        input_example.datapoint, reference_runner
     )
   except ValueError:
     logging.exception(
@@ -152,13 +161,14 @@ def _eval_sample(
     )
     return None
 
-  with concurrent.futures.ThreadPoolExecutor(5) as executor:
+  with concurrent.futures.ThreadPoolExecutor(_NUM_CONCURRENT_RUNS) as executor:
 
     def _check_sample_pass(
         synthesized_code: str,
     ) -> concurrent.futures.Future[bool]:
       return executor.submit(
           _compute_sample_pass,
+          runner_pool,
           filepath,
           prefix,
           suffix,
@@ -183,28 +193,45 @@ def main(argv: Sequence[str]) -> None:
           rtcd.GenerationSamplesForDatapoint[synthesis_rtc.SynthesisRtcExample]
       ]
   ):
-    with gzip.open(open(_INPUT_FILE.value, "rb")) as f:
-      for line in f:
-        sample = rtcd.GenerationSamplesForDatapoint.from_json(line.decode())
-        sample.datapoint = synthesis_rtc.SynthesisRtcExample.from_dict(
-            sample.datapoint
+    decode_datapoint = rtcd.make_decoder(synthesis_rtc.SynthesisRtcExample)
+    for line in gzip_utils.iter_lines(_INPUT_FILE.value):
+      sample = rtcd.generation_samples_from_dict(orjson.loads(line))
+      sample.datapoint = decode_datapoint(sample.datapoint)
+      yield sample
+
+  with (
+      gzip_utils.open_write(_OUTPUT_FILE.value, append=True) as f,
+      contextlib.ExitStack() as stack,
+  ):
+    # The reference runner keeps the original code, which is used to extract
+    # the context of each example.
+    reference_runner = stack.enter_context(
+        program_runner.ProgramRunner(
+            _TARGET_PROGRAM_TAR.value, _IMAGE_NAME.value
         )
-        yield sample
-
-  with gzip.open(open(_OUTPUT_FILE.value, "ab"), "ab") as f:
-    runner = program_runner.ProgramRunner(
-        _TARGET_PROGRAM_TAR.value, _IMAGE_NAME.value
     )
     # Get baseline
-    baseline_pytest_report = _get_pytest_summary(runner)
+    baseline_pytest_report = _get_pytest_summary(reference_runner)
     logging.info("Baseline pytest report: %s", baseline_pytest_report)
 
+    # Runners, and their containers, are reused across the samples.
+    runner_pool = queue.SimpleQueue()
+    for _ in range(_NUM_CONCURRENT_RUNS):
+      runner_pool.put(
+          stack.enter_context(
+              program_runner.ProgramRunner(
+                  _TARGET_PROGRAM_TAR.value, _IMAGE_NAME.value
+              )
+          )
+      )
+
     for input_example in load_samples():
-      sample = _eval_sample(input_example, baseline_pytest_report)
+      sample = _eval_sample(
+          input_example, baseline_pytest_report, reference_runner, runner_pool
+      )
       if sample is None:
         continue
-      f.write(sample.to_json().encode())
-      f.write(b"\n")
+      f.write(orjson.dumps(sample, option=orjson.OPT_APPEND_NEWLINE))
 
 
 if __name__ == "__main__":
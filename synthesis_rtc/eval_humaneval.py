@@ -15,17 +15,19 @@
 
 """Run RTC execution evaluation on HumanEval."""
 
-from collections.abc import Sequence
+import collections
+from collections.abc import Iterator, Sequence
 import concurrent.futures
-import gzip
-import io
+import functools
 import textwrap
-from typing import Any
+from typing import Any, Final
 
 from absl import app
 from absl import flags
-import tensorflow_datasets as tfds
+import datasets
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness import rtc_data as med
 from roundtrip_correctness.synthesis_rtc import eval_utils
 from roundtrip_correctness.synthesis_rtc import task as srtc
@@ -42,6 +44,14 @@ _NUM_CONCURRENT_CONTAINERS = flags.DEFINE_integer(
     "num_concurrent_containers", 10, "The number of concurrent containers."
 )
 
+_PROGRAMS_PER_BATCH = flags.DEFINE_integer(
+    "programs_per_batch",
+    4,
+    "The number of programs run one after the other in a container per"
+    " execution. Larger batches amortize the overhead of each execution, but"
+    " spread the tests less evenly over the containers.",
+)
+
 _OUTPUT_FILE = flags.DEFINE_string(
     "output_file",
     None,
@@ -56,65 +66,89 @@ _DOCKER_RUNTIME = flags.DEFINE_string(
     "docker_runtime", "runc", "The Docker runtime."
 )
 
+# The number of problems whose tests are queued or running, per container.
+# This keeps the containers busy at the boundaries between problems, without
+# reading all samples into memory.
+_PROBLEMS_IN_FLIGHT_PER_CONTAINER: Final[int] = 4
 
-def _humaneval_by_id() -> dict[int, Any]:
-  """Load HumanEval dataset by their task id."""
-  ds = tfds.load("huggingface:openai_humaneval/openai_humaneval")
-  samples = {}
-  for sample in ds["test"]:
-    samples[
-        int(
-            sample["task_id"]
-            .numpy()
-            .decode()
-            .removeprefix("HumanEval/")
-            .removesuffix(".py")
-        )
-    ] = sample
-  return samples
 
-
-def _samples_by_id() -> (
-    dict[int, med.GenerationSamplesForDatapoint[srtc.SynthesisRtcExample]]
+def _humaneval_by_id() -> dict[int, dict[str, Any]]:
+  """Load HumanEval dataset by their task id."""
+  ds = datasets.load_dataset("openai_humaneval", split="test")
+  return {
+      int(
+          sample["task_id"].removeprefix("HumanEval/").removesuffix(".py")
+      ): sample
+      for sample in ds
+  }
+
+
+def _iter_samples() -> (
+    Iterator[
+        tuple[int, med.GenerationSamplesForDatapoint[srtc.SynthesisRtcExample]]
+    ]
 ):
-  """Load samples by their MBPP problem id."""
-  samples_per_problem = {}
-
-  with gzip.open(open(_SAMPLES_PATH.value, "rb")) as f:
-    for line in f:
-      sample = med.GenerationSamplesForDatapoint.from_json(line.decode())
-      sample.datapoint = srtc.SynthesisRtcExample.from_dict(sample.datapoint)
-      problem_id = int(
-          sample.datapoint.filename[len("HumanEval/") : -len(".py")]
-      )
-      assert problem_id not in samples_per_problem
-      samples_per_problem[problem_id] = sample
-  return samples_per_problem
+  """Iterates over the samples and their HumanEval problem id."""
+  decode_datapoint = med.make_decoder(srtc.SynthesisRtcExample)
+  seen_problem_ids = set()
+  for line in gzip_utils.iter_lines(_SAMPLES_PATH.value):
+    sample = med.generation_samples_from_dict(orjson.loads(line))
+    sample.datapoint = decode_datapoint(sample.datapoint)
+    problem_id = int(sample.datapoint.filename[len("HumanEval/") : -len(".py")])
+    assert problem_id not in seen_problem_ids
+    seen_problem_ids.add(problem_id)
+    yield problem_id, sample
+
+
+def _test_code(humaneval_problem_def: dict[str, Any]) -> str:
+  """Returns the code that tests a solution of a HumanEval problem."""
+  return (
+      f"{humaneval_problem_def['test']}\n"
+      f"check({humaneval_problem_def['entry_point']})\n"
+  )
 
 
 def _construct_runnable_test(
-    humaneval_problem_def: dict[str, Any],
     datapoint: srtc.SynthesisRtcExample,
     sample: str,
+    test_code: str,
 ) -> str:
-  """Creates the string of a test in HumanEval."""
-  with io.StringIO() as sb:
-    bw_sample = textwrap.indent(
-        textwrap.dedent(sample),
-        datapoint.indentation,
-    )
-    # Force-fix first line indentation
-    # bw_sample = datapoint.indentation + bw_sample.lstrip()
-    sb.write(
-        f"{datapoint.code_before_hole}\n{bw_sample}\n{datapoint.code_after_hole}\n"
-    )
-
-    sb.write(humaneval_problem_def["test"].numpy().decode())
-    sb.write("\n")
-    sb.write(
-        f"check({humaneval_problem_def['entry_point'].numpy().decode()})\n"
-    )
-    return sb.getvalue()
+  """Creates the string of a test in HumanEval.
+
+  Args:
+    datapoint: The example whose hole is filled.
+    sample: The code filling the hole.
+    test_code: The code testing the problem, as returned by `_test_code`. It
+      only depends on the problem, so it is computed once for all samples.
+
+  Returns:
+    The code of the test.
+  """
+  bw_sample = textwrap.indent(
+      textwrap.dedent(sample),
+      datapoint.indentation,
+  )
+  # Force-fix first line indentation
+  # bw_sample = datapoint.indentation + bw_sample.lstrip()
+  return (
+      f"{datapoint.code_before_hole}\n{bw_sample}\n"
+      f"{datapoint.code_after_hole}\n{test_code}"
+  )
+
+
+def _check_batch_pass(
+    pool: concurrent.futures.Executor,
+    containers: eval_utils.ContainerPool,
+    datapoint: srtc.SynthesisRtcExample,
+    test_code: str,
+    predicted_codes: Sequence[str],
+) -> concurrent.futures.Future[list[bool]]:
+  """Submits the tests of a batch of samples of a problem."""
+  codes = [
+      _construct_runnable_test(datapoint, predicted_code, test_code)
+      for predicted_code in predicted_codes
+  ]
+  return pool.submit(containers.run_and_check_exit_codes, codes)
 
 
 def main(argv: Sequence[str]) -> None:
@@ -122,36 +156,56 @@ def main(argv: Sequence[str]) -> None:
     raise app.UsageError("Too many command-line arguments.")
 
   humaneval_dataset = _humaneval_by_id()
-  eval_samples_by_id = _samples_by_id()
+  max_problems_in_flight = (
+      _PROBLEMS_IN_FLIGHT_PER_CONTAINER * _NUM_CONCURRENT_CONTAINERS.value
+  )
   with (
-      gzip.open(open(_OUTPUT_FILE.value, "wb"), "wb") as f,
+      gzip_utils.open_write(_OUTPUT_FILE.value) as f,
+      eval_utils.ContainerPool(
+          _IMAGE_NAME.value,
+          _DOCKER_RUNTIME.value,
+          _NUM_CONCURRENT_CONTAINERS.value,
+      ) as containers,
       concurrent.futures.ThreadPoolExecutor(
           max_workers=_NUM_CONCURRENT_CONTAINERS.value
       ) as pool,
+      # Each of these threads waits for the tests of one problem, so that the
+      # tests of several problems are queued for the containers at once.
+      concurrent.futures.ThreadPoolExecutor(
+          max_workers=max_problems_in_flight
+      ) as problems_pool,
   ):
-    for problem_id, problem_samples in eval_samples_by_id.items():
-      # This is fine since check_pass is used per-iteration,
-      # pylint: disable=cell-var-from-loop
-      def check_pass(predicted_code: str) -> concurrent.futures.Future[bool]:
-        code = _construct_runnable_test(
-            humaneval_dataset[problem_id],
-            problem_samples.datapoint,
-            predicted_code,
+    # Results are written in the order of the samples.
+    in_flight = collections.deque()
+    for problem_id, problem_samples in _iter_samples():
+      if len(in_flight) >= max_problems_in_flight:
+        f.write(
+            orjson.dumps(
+                in_flight.popleft().result(),
+                option=orjson.OPT_APPEND_NEWLINE,
+            )
         )
-        return pool.submit(
-            eval_utils.run_and_check_exit_code,
-            code,
-            _IMAGE_NAME.value,
-            _DOCKER_RUNTIME.value,
-        )
-
-      # pylint: enable=cell-var-from-loop
-      evaluated_problem_samples = eval_utils.evaluate_generated_output(
-          problem_samples, check_pass
+      check_batch_pass = functools.partial(
+          _check_batch_pass,
+          pool,
+          containers,
+          problem_samples.datapoint,
+          _test_code(humaneval_dataset[problem_id]),
+      )
+      in_flight.append(
+          problems_pool.submit(
+              eval_utils.evaluate_generated_output_in_batches,
+              problem_samples,
+              check_batch_pass,
+              _PROGRAMS_PER_BATCH.value,
+          )
+      )
+    while in_flight:
+      f.write(
+          orjson.dumps(
+              in_flight.popleft().result(), option=orjson.OPT_APPEND_NEWLINE
+          )
       )
-
-      f.write(evaluated_problem_samples.to_json().encode())
-      f.write(b"\n")
 
 
 if __name__ == "__main__":
@@ -15,100 +15,229 @@
 
 """A generic wrapper around evaluation."""
 
-from collections.abc import Callable
+from collections.abc import Callable, Sequence
 import concurrent.futures
 import itertools
 import os
+import queue
 import tempfile
+from typing import Final
 
 from absl import logging
 import docker
-import requests
 
 from roundtrip_correctness import rtc_data as rtcd
 from roundtrip_correctness.synthesis_rtc import task as d2s
 
 
-def run_and_check_exit_code(
-    code: str, image_name: str, docker_runtime: str
-) -> bool:
-  """Run the given code and check if a non 0 exit code has been returned."""
-  docker_client = docker.from_env()
-  with tempfile.TemporaryDirectory() as code_tmpdir:
-    with open(os.path.join(code_tmpdir, "program.py"), "w") as f:
-      f.write(code)
-
-    container = docker_client.containers.run(
-        image=image_name,
-        command="python /code/program.py",
-        volumes={
-            code_tmpdir: {"bind": "/code/", "mode": "ro"},
-        },
-        network_disabled=True,
-        runtime=docker_runtime,
-        ulimits=[
-            docker.types.containers.Ulimit(name="nproc", soft=100, hard=10000),
-            docker.types.containers.Ulimit(
-                name="cpu", soft=60, hard=120
-            ),  # Seconds
-            docker.types.containers.Ulimit(
-                name="memlock", soft=10 * 1024, hard=1024 * 1024
-            ),  # in KB
-        ],
-        detach=True,
-    )
+# The maximum wall time of a program, in seconds.
+_PROGRAM_TIMEOUT_SEC: Final[int] = 90
+
+# The time after which a timed out program that ignores SIGTERM is killed.
+_KILL_GRACE_SEC: Final[int] = 5
+
+# The exit code of `timeout` when the command timed out.
+_TIMEOUT_EXIT_CODE: Final[int] = 124
+
+# Runs the programs one after the other and prints their exit codes. The
+# processes left behind by a program are killed so that they do not affect the
+# programs run after it in the same container.
+_RUN_PROGRAMS_SCRIPT: Final[str] = (
+    "for program in {programs}; do"
+    f" timeout -k {_KILL_GRACE_SEC} {_PROGRAM_TIMEOUT_SEC}"
+    " python /code/$program >/dev/null 2>&1;"
+    " echo $?; kill -9 -1 2>/dev/null; done"
+)
+
+
+class ContainerPool:
+  """A pool of long-lived containers in which programs are run.
+
+  Starting a container takes seconds, much longer than most of the programs
+  run in it. Instead, the containers are started once and each program is
+  executed in an idle container of the pool.
+  """
+
+  def __init__(self, image_name: str, docker_runtime: str, num_containers: int):
+    self._docker_client = docker.from_env()
+    self._code_dirs = []
+    self._containers = []
+    self._idle = queue.SimpleQueue()
     try:
-      exit_info = str(container.wait(timeout=90))
-      logging.info("Task exited with %s", exit_info)
-      container.stop()
-      container.remove(force=True)
-    except requests.exceptions.ConnectionError:
-      logging.exception("Timeout for task: Container stopped.")
-      exit_info = '"Timeout for task %s: Container stopped."'
-      container.pause()
+      for _ in range(num_containers):
+        code_dir = tempfile.TemporaryDirectory()
+        self._code_dirs.append(code_dir)
+        container = self._docker_client.containers.run(
+            image=image_name,
+            command="sleep infinity",
+            volumes={
+                code_dir.name: {"bind": "/code/", "mode": "ro"},
+            },
+            network_disabled=True,
+            runtime=docker_runtime,
+            ulimits=[
+                docker.types.containers.Ulimit(
+                    name="nproc", soft=100, hard=10000
+                ),
+                docker.types.containers.Ulimit(
+                    name="cpu", soft=60, hard=120
+                ),  # Seconds
+                docker.types.containers.Ulimit(
+                    name="memlock", soft=10 * 1024, hard=1024 * 1024
+                ),  # in KB
+            ],
+            detach=True,
+        )
+        self._containers.append(container)
+        self._idle.put((container, code_dir.name))
+    except BaseException:
+      self.close()
+      raise
 
-    return exit_info == "{'Error': None, 'StatusCode': 0}"
+  def __enter__(self) -> "ContainerPool":
+    return self
 
+  def __exit__(self, *exc_info) -> None:
+    self.close()
 
-def evaluate_generated_output(
+  def close(self) -> None:
+    """Stops and removes all containers of the pool."""
+    for container in self._containers:
+      try:
+        container.remove(force=True)
+      except docker.errors.APIError:
+        logging.exception("Could not stop or remove container.")
+    self._containers.clear()
+    for code_dir in self._code_dirs:
+      code_dir.cleanup()
+    self._code_dirs.clear()
+
+  def run_and_check_exit_codes(self, codes: Sequence[str]) -> list[bool]:
+    """Runs the given programs and checks which exited with a 0 exit code.
+
+    All programs are run in the same container with a single `exec`, which
+    amortizes its overhead over the programs.
+
+    Args:
+      codes: The code of each program.
+
+    Returns:
+      Whether each program exited with a 0 exit code.
+    """
+    program_names = [f"program_{i}.py" for i in range(len(codes))]
+    container, code_dir = self._idle.get()
+    try:
+      for program_name, code in zip(program_names, codes):
+        with open(os.path.join(code_dir, program_name), "w") as f:
+          f.write(code)
+      _, output = container.exec_run([
+          "sh",
+          "-c",
+          _RUN_PROGRAMS_SCRIPT.format(programs=" ".join(program_names)),
+      ])
+    finally:
+      self._idle.put((container, code_dir))
+
+    exit_codes = output.split()
+    if len(exit_codes) != len(codes):
+      logging.error("Unexpected output of the programs: %r", output)
+      return [False] * len(codes)
+    for exit_code in exit_codes:
+      if exit_code == b"%d" % _TIMEOUT_EXIT_CODE:
+        logging.info("Timeout for task: Program stopped.")
+      else:
+        logging.info("Task exited with %s", exit_code.decode())
+    return [exit_code == b"0" for exit_code in exit_codes]
+
+
+def _sample_texts(
     generation_samples: rtcd.GenerationSamplesForDatapoint[
         d2s.SynthesisRtcExample
     ],
-    check_pass: Callable[[str], concurrent.futures.Future[bool]],
-) -> rtcd.EvaluatedGenerationSamplesForDatapoint[d2s.SynthesisRtcExample]:
-  """Concurrently evaluate the generated output."""
-  gen_samples_pass_futures = []
+) -> list[str]:
+  """Returns the texts of the baseline samples and then of the bw samples."""
+  texts = [s.text for s in generation_samples.baseline_samples or ()]
   for fw_sample in generation_samples.generation_samples:
-    fw_sample_pass_futures = []
-    gen_samples_pass_futures.append(fw_sample_pass_futures)
-    for bw_sample in fw_sample.backward_samples:
-      fw_sample_pass_futures.append(check_pass(bw_sample.text))
-
-  baseline_samples_pass_futures = []
-  if generation_samples.baseline_samples:
-    for baseline_sample in generation_samples.baseline_samples:
-      baseline_samples_pass_futures.append(check_pass(baseline_sample.text))
-
-  all_futures = list(
-      itertools.chain(baseline_samples_pass_futures, *gen_samples_pass_futures)
-  )
-  concurrent.futures.wait(all_futures)
+    texts.extend(bw_sample.text for bw_sample in fw_sample.backward_samples)
+  return texts
+
+
+def _evaluated_samples_from_passes(
+    generation_samples: rtcd.GenerationSamplesForDatapoint[
+        d2s.SynthesisRtcExample
+    ],
+    passes: Sequence[bool],
+) -> rtcd.EvaluatedGenerationSamplesForDatapoint[d2s.SynthesisRtcExample]:
+  """Builds the evaluated samples from whether each sample passes.
+
+  Args:
+    generation_samples: The evaluated samples.
+    passes: Whether each sample passes, in the order of `_sample_texts`.
+
+  Returns:
+    The evaluated samples.
+  """
+  passes_iter = iter(passes)
+  baseline_samples_passes = [
+      1.0 if next(passes_iter) else 0.0
+      for _ in generation_samples.baseline_samples or ()
+  ]
+  gen_samples_passes = [
+      [1.0 if next(passes_iter) else 0.0 for _ in fw.backward_samples]
+      for fw in generation_samples.generation_samples
+  ]
 
   evaluated_problem_samples = rtcd.EvaluatedGenerationSamplesForDatapoint[
       d2s.SynthesisRtcExample
   ](
       samples=generation_samples,
-      generation_samples_consistencies={
-          "pass": [
-              [1.0 if f.result() else 0.0 for f in fw_sample_pass_futures]
-              for fw_sample_pass_futures in gen_samples_pass_futures
-          ]
-      },
-      baseline_samples_consistencies={
-          "pass": [
-              1.0 if f.result() else 0.0 for f in baseline_samples_pass_futures
-          ]
-      },
+      generation_samples_consistencies={"pass": gen_samples_passes},
+      baseline_samples_consistencies={"pass": baseline_samples_passes},
   )
   evaluated_problem_samples.validate_sizes()
   return evaluated_problem_samples
+
+
+def evaluate_generated_output(
+    generation_samples: rtcd.GenerationSamplesForDatapoint[
+        d2s.SynthesisRtcExample
+    ],
+    check_pass: Callable[[str], concurrent.futures.Future[bool]],
+) -> rtcd.EvaluatedGenerationSamplesForDatapoint[d2s.SynthesisRtcExample]:
+  """Concurrently evaluate the generated output."""
+  futures = [check_pass(text) for text in _sample_texts(generation_samples)]
+  concurrent.futures.wait(futures)
+  return _evaluated_samples_from_passes(
+      generation_samples, [f.result() for f in futures]
+  )
+
+
+def evaluate_generated_output_in_batches(
+    generation_samples: rtcd.GenerationSamplesForDatapoint[
+        d2s.SynthesisRtcExample
+    ],
+    check_batch_pass: Callable[
+        [Sequence[str]], concurrent.futures.Future[list[bool]]
+    ],
+    batch_size: int,
+) -> rtcd.EvaluatedGenerationSamplesForDatapoint[d2s.SynthesisRtcExample]:
+  """Concurrently evaluate the generated output, in batches of samples.
+
+  Args:
+    generation_samples: The samples to evaluate.
+    check_batch_pass: Checks whether each sample of a batch passes.
+    batch_size: The maximum number of samples per batch.
+
+  Returns:
+    The evaluated samples.
+  """
+  texts = _sample_texts(generation_samples)
+  futures = [
+      check_batch_pass(texts[i : i + batch_size])
+      for i in range(0, len(texts), batch_size)
+  ]
+  concurrent.futures.wait(futures)
+  return _evaluated_samples_from_passes(
+      generation_samples,
+      list(itertools.chain.from_iterable(f.result() for f in futures)),
+  )
@@ -161,15 +161,12 @@ def _adjust_start_and_end_pos(
     code_bytes, start_pos, end_pos
 ) -> tuple[int, int]:
   """Adjusts start and end pos to whole lines."""
-  # Ensure that start_pos is just after \n
-  while (
-      start_pos - 1 >= 0
-      and code_bytes[start_pos - 1 : start_pos].isspace()
-      and code_bytes[start_pos : start_pos + 1] != b"\n"
-  ):
-    start_pos -= 1
+  # Ensure that start_pos is just after \n, with only whitespace in between.
   if code_bytes[start_pos : start_pos + 1] != b"\n":
-    raise _NotFullLineError()
+    line_start = code_bytes.rfind(b"\n", 0, start_pos)
+    if line_start < 0 or code_bytes[line_start + 1 : start_pos].strip():
+      raise _NotFullLineError()
+    start_pos = line_start
 
   start_pos += 1
 
@@ -177,10 +174,8 @@ def _adjust_start_and_end_pos(
   # This consumes any subsequent comment. In rare cases, this may consume
   #  part of the subsequent statement (e.g. when there are multiple
   # statements in a single line). This is indented behavior for now.
-  while (
-      end_pos < len(code_bytes) and code_bytes[end_pos : end_pos + 1] != b"\n"
-  ):
-    end_pos += 1
+  line_end = code_bytes.find(b"\n", end_pos)
+  end_pos = len(code_bytes) if line_end < 0 else line_end
   end_pos += 1
 
   return start_pos, end_pos
@@ -205,10 +200,11 @@ def extract_samples_from_file(
     logging.warning("Error parsing %s", filepath)
     return
 
+  is_sampled_context = _IS_SAMPLED_CONTEXT[suffix]
   if eligible_lines:
 
     def is_eligible_subtree_predicate(node: ts.Node) -> bool:
-      if not _IS_SAMPLED_CONTEXT[suffix](node):
+      if not is_sampled_context(node):
         return False
 
       return any(
@@ -218,7 +214,7 @@ def extract_samples_from_file(
       )
 
   else:
-    is_eligible_subtree_predicate = _IS_SAMPLED_CONTEXT[suffix]
+    is_eligible_subtree_predicate = is_sampled_context
 
   samples = syntax_constrained_sampling.sample(
       tree,
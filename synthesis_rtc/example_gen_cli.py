@@ -15,15 +15,21 @@
 
 """A CLI to extract samples from a given file."""
 
+import collections
 from collections.abc import Sequence
+import concurrent.futures
 import glob
-import gzip
 import logging
 import os
+import sys
+from typing import Final
 
 from absl import app
 from absl import flags
+import numpy as np
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness.synthesis_rtc import example_gen
 
 
@@ -33,22 +39,65 @@ _INPUT_FOLDER = flags.DEFINE_string(
 
 _OUT_PATH = flags.DEFINE_string("out_path", None, "Output path.", required=True)
 
+_NUM_WORKERS = flags.DEFINE_integer(
+    "num_workers",
+    None,
+    "The number of worker processes. Defaults to the number of CPUs.",
+)
+
+# The number of files in flight per worker. This keeps the workers busy while
+# the main process compresses, without queuing all files at once.
+_FILES_IN_FLIGHT_PER_WORKER: Final[int] = 4
+
+
+def _init_worker(argv: list[str]) -> None:
+  """Initializes a worker process."""
+  # Workers that are not forked from the main process need to parse the flags.
+  if not flags.FLAGS.is_parsed():
+    flags.FLAGS(argv)
+  # Forked workers inherit the random state of the main process, and would
+  # otherwise all draw the same random numbers.
+  np.random.seed()
+
+
+def _extract_samples(filename: str, input_folder: str) -> bytes:
+  """Extracts the samples of a file, serialized as json lines."""
+  serialized_examples = []
+  for example in example_gen.extract_samples_from_file(filename):
+    example.filename = os.path.relpath(filename, input_folder)
+    serialized_examples.append(
+        orjson.dumps(example, option=orjson.OPT_APPEND_NEWLINE)
+    )
+  return b"".join(serialized_examples)
+
 
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError("Too many command-line arguments.")
+  num_workers = _NUM_WORKERS.value or os.cpu_count() or 1
+  max_in_flight = num_workers * _FILES_IN_FLIGHT_PER_WORKER
 
-  with gzip.open(open(_OUT_PATH.value, "wb"), "wb") as f:
+  with (
+      concurrent.futures.ProcessPoolExecutor(
+          num_workers, initializer=_init_worker, initargs=(sys.argv,)
+      ) as executor,
+      gzip_utils.open_write(_OUT_PATH.value) as f,
+  ):
+    # Results are written in the order of the files.
+    in_flight = collections.deque()
     for filename in glob.iglob(
         os.path.join(_INPUT_FOLDER.value, "*"), recursive=True
     ):
       if "test" in filename.lower():
         logging.info("Skipping %s because it looks like a test.", filename)
         continue
-      for example in example_gen.extract_samples_from_file(filename):
-        example.filename = os.path.relpath(filename, _INPUT_FOLDER.value)
-        f.write(example.to_json().encode())
-        f.write(b"\n")
+      if len(in_flight) >= max_in_flight:
+        f.write(in_flight.popleft().result())
+      in_flight.append(
+          executor.submit(_extract_samples, filename, _INPUT_FOLDER.value)
+      )
+    while in_flight:
+      f.write(in_flight.popleft().result())
 
 
 if __name__ == "__main__":
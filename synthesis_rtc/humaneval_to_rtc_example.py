@@ -16,14 +16,15 @@
 """Convert HumanEval to a SynthesisRtcExample dataset."""
 
 from collections.abc import Iterator, Sequence
-import gzip
 import re
 
 from absl import app
 from absl import flags
+import datasets
 import libcst as cst
-import tensorflow_datasets as tfds
+import orjson
 
+from roundtrip_correctness import gzip_utils
 from roundtrip_correctness.synthesis_rtc import task as synth_rtc
 
 _OUT_PATH = flags.DEFINE_string(
@@ -62,11 +63,11 @@ class _RemoveDocstring(cst.CSTTransformer):
 
 def _iter_humaneval() -> Iterator[synth_rtc.SynthesisRtcExample]:
   """Iterates over all HumanEval problems and generates the code-to-be-traced."""
-  ds = tfds.load("huggingface:openai_humaneval/openai_humaneval")
+  ds = datasets.load_dataset("openai_humaneval", split="test")
 
-  for d in ds["test"]:
-    prompt = d["prompt"].numpy().decode()
-    canonical_solution = d["canonical_solution"].numpy().decode()
+  for d in ds:
+    prompt = d["prompt"]
+    canonical_solution = d["canonical_solution"]
     if not prompt.endswith("\n"):
       prompt = prompt + "\n"
 
@@ -81,7 +82,7 @@ def _iter_humaneval() -> Iterator[synth_rtc.SynthesisRtcExample]:
     code_no_docstrings = code_no_docstrings.splitlines(keepends=True)
     num_lines = len(code_no_docstrings)
 
-    task_id = d["task_id"].numpy().decode()
+    task_id = d["task_id"]
 
     yield synth_rtc.SynthesisRtcExample(
         filename=f"{task_id}.py",
@@ -101,10 +102,9 @@ def _iter_humaneval() -> Iterator[synth_rtc.SynthesisRtcExample]:
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError("Too many command-line arguments.")
-  with gzip.open(open(_OUT_PATH.value, "wb"), "wb") as f:
+  with gzip_utils.open_write(_OUT_PATH.value) as f:
     for e in _iter_humaneval():
-      f.write(e.to_json().encode())
-      f.write(b"\n")
+      f.write(orjson.dumps(e, option=orjson.OPT_APPEND_NEWLINE))
 
 
 if __name__ == "__main__":
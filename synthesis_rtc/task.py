@@ -18,7 +18,6 @@
 from __future__ import annotations
 
 import dataclasses
-import io
 import textwrap
 from typing import Collection
 
@@ -31,7 +30,7 @@ from roundtrip_correctness import rtc_task as rtct
 
 
 @dataclasses_json.dataclass_json
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class SynthesisRtcExample:
   """A code span <-> natural language description RTC example."""
 
@@ -63,12 +62,8 @@ class SynthesisRtcExample:
     if self.code_in_hole[-1] != '\n':
       raise ValueError('`code_in_hole` should end with a new line.')
 
-    indent_idx = 0
-    while indent_idx < len(self.code_in_hole):
-      if not self.code_in_hole[indent_idx].isspace():
-        break
-      indent_idx += 1
-    self.indentation = self.code_in_hole[:indent_idx]
+    indent_len = len(self.code_in_hole) - len(self.code_in_hole.lstrip())
+    self.indentation = self.code_in_hole[:indent_len]
 
   def code_with_annotated_code_region(
       self, start_region_text: str, end_region_text: str
@@ -173,34 +168,31 @@ class SynthesisRtc(rtct.RoundTripCorrectnessTask[SynthesisRtcExample]):
       samples: rtcd.GenerationSamplesForDatapoint[SynthesisRtcExample],
   ) -> str:
     """See base class."""
-    with io.StringIO() as sb:
-      input_sample = samples.datapoint
-      sb.write(
-          f'<h2>{input_sample.filename} '
-          f'({input_sample.start_point}-{input_sample.end_point})</h2>\n'
-      )
-      sb.write('<pre>\n')
-      sb.write(input_sample.code_before_hole)
-      sb.write('<span style="color:darkred; font-weight:bold;">')
-      sb.write(input_sample.code_in_hole)
-      sb.write('</span>')
-      sb.write(input_sample.code_after_hole)
-      sb.write('</pre>\n<h4>Forward Samples</h4>\n')
-      sb.write('<ol>')
-      for generation_sample in samples.generation_samples:
-        fw_sample = generation_sample.forward_sample
-        sb.write(f'<li>{fw_sample.text} ({fw_sample.logprob:.2f})</li>\n')
-      sb.write('</ol>\n')
-
-      sb.write('<h4>Backwards Samples</h4>\n<table>')
-      for i, sample in enumerate(samples.generation_samples, start=1):
-        sb.write(f'<tr><td>{i}</td>\n')
-        for bw_sample in sample.backward_samples:
-          sb.write(
-              f'<td><pre> {bw_sample.text}</pre>'
-              f' <br/>({bw_sample.logprob:.2f})</td>'
-          )
-        sb.write('</tr>\n')
-
-      sb.write('</table>\n')
-      return sb.getvalue()
+    input_sample = samples.datapoint
+    forward_items = ''.join(
+        f'<li>{sample.forward_sample.text} '
+        f'({sample.forward_sample.logprob:.2f})</li>\n'
+        for sample in samples.generation_samples
+    )
+    backward_rows = ''.join(
+        f'<tr><td>{i}</td>\n'
+        + ''.join(
+            f'<td><pre> {bw_sample.text}</pre>'
+            f' <br/>({bw_sample.logprob:.2f})</td>'
+            for bw_sample in sample.backward_samples
+        )
+        + '</tr>\n'
+        for i, sample in enumerate(samples.generation_samples, start=1)
+    )
+    return (
+        f'<h2>{input_sample.filename} '
+        f'({input_sample.start_point}-{input_sample.end_point})</h2>\n'
+        '<pre>\n'
+        f'{input_sample.code_before_hole}'
+        '<span style="color:darkred; font-weight:bold;">'
+        f'{input_sample.code_in_hole}</span>'
+        f'{input_sample.code_after_hole}'
+        '</pre>\n<h4>Forward Samples</h4>\n'
+        f'<ol>{forward_items}</ol>\n'
+        f'<h4>Backwards Samples</h4>\n<table>{backward_rows}</table>\n'
+    )
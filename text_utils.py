@@ -15,9 +15,13 @@
 
 """Creates line-level code spans with additional context."""
 import dataclasses
+from typing import Final
 
+# The maximum number of bytes of a character encoded in UTF-8.
+_MAX_UTF8_CHAR_BYTES: Final[int] = 4
 
-@dataclasses.dataclass(frozen=True)
+
+@dataclasses.dataclass(frozen=True, slots=True)
 class SpanWithContext:
   """A span with context."""
 
@@ -26,6 +30,11 @@ class SpanWithContext:
   right_context: str
 
 
+def _is_continuation_byte(byte: int) -> bool:
+  """Returns whether the byte continues a multi-byte UTF-8 character."""
+  return byte & 0xC0 == 0x80
+
+
 def get_span_with_context(
     file_bytes: bytes,
     start_pos: int,
@@ -64,9 +73,24 @@ def get_span_with_context(
         f" ({start_pos})."
     )
 
-  hole_prefix = file_bytes[:start_pos].decode()
   hole = file_bytes[start_pos:end_pos].decode()
-  hole_suffix = file_bytes[end_pos:].decode()
+
+  # Only the bytes around the span are decoded, instead of the whole file. If
+  # they do not reach the start (resp. end) of the file, they contain more
+  # than `context_chars` characters, i.e. more than the budget of either side.
+  window_size = _MAX_UTF8_CHAR_BYTES * (context_chars + 1)
+  left_window_start = max(0, start_pos - window_size)
+  while left_window_start < start_pos and _is_continuation_byte(
+      file_bytes[left_window_start]
+  ):
+    left_window_start += 1
+  right_window_end = min(len(file_bytes), end_pos + window_size)
+  while end_pos < right_window_end < len(file_bytes) and _is_continuation_byte(
+      file_bytes[right_window_end]
+  ):
+    right_window_end -= 1
+  hole_prefix = file_bytes[left_window_start:start_pos].decode()
+  hole_suffix = file_bytes[end_pos:right_window_end].decode()
 
   # Use the same number of left and right context, unless one of them is
   # shorter.
@@ -78,15 +102,36 @@ def get_span_with_context(
   elif len(hole_suffix) < right_context_budget:
     left_context_budget += right_context_budget - len(hole_suffix)
 
-  # Truncate to include the entire lines.
+  # Truncate to include the entire lines. New lines are single bytes in UTF-8,
+  # so they are searched in the bytes outside of the decoded windows.
   left_idx = hole_prefix.rfind(
       "\n", 0, max(0, len(hole_prefix) - left_context_budget)
   )
-  if left_idx != -1 and left_idx > 0:
+  if left_idx != -1 and (left_idx > 0 or left_window_start > 0):
     hole_prefix = truncation_delimiter + hole_prefix[left_idx:]
+  elif left_window_start > 0:
+    left_byte_idx = file_bytes.rfind(b"\n", 0, left_window_start)
+    if left_byte_idx > 0:
+      hole_prefix = (
+          truncation_delimiter + file_bytes[left_byte_idx:start_pos].decode()
+      )
+    else:
+      hole_prefix = file_bytes[:start_pos].decode()
 
   right_idx = hole_suffix.find("\n", right_context_budget)
-  if right_idx != -1 and right_idx < len(hole_suffix) - 1:
+  if right_idx == -1 and right_window_end < len(file_bytes):
+    right_byte_idx = file_bytes.find(b"\n", right_window_end)
+    if right_byte_idx != -1 and right_byte_idx < len(file_bytes) - 1:
+      hole_suffix = (
+          file_bytes[end_pos:right_byte_idx].decode()
+          + "\n"
+          + truncation_delimiter
+      )
+    else:
+      hole_suffix = file_bytes[end_pos:].decode()
+  elif right_idx != -1 and (
+      right_idx < len(hole_suffix) - 1 or right_window_end < len(file_bytes)
+  ):
     hole_suffix = hole_suffix[:right_idx] + "\n" + truncation_delimiter
 
   return SpanWithContext(hole_prefix, hole, hole_suffix)
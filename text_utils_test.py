@@ -82,6 +82,23 @@ class TextUtilsTest(parameterized.TestCase):
     )
     self.assertEqual(output, expected_out)
 
+  def test_span_with_context_in_long_non_ascii_text(self):
+    lines = [f"line {i}: é€😀\n" for i in range(100)]
+    file_bytes = "".join(lines).encode()
+    start_pos = len("".join(lines[:50]).encode())
+    end_pos = start_pos + len(lines[50].encode())
+
+    output = text_utils.get_span_with_context(
+        file_bytes, start_pos, end_pos, context_chars=20
+    )
+
+    self.assertEqual(
+        output,
+        text_utils.SpanWithContext(
+            f"...\n{lines[49]}", lines[50], f"{lines[51]}..."
+        ),
+    )
+
 
 if __name__ == "__main__":
   absltest.main()